@@ -1,4 +1,6 @@
 import pygame
+from assets_fightinggame import sprite_cache
+from character_stats_fightinggame import character_stats
 
 class Character:
     def __init__(self, name, x, y):
@@ -26,72 +28,40 @@ class Character:
 
         self.rect = pygame.Rect(x - self.scale[0]//2, y - self.scale[1], self.scale[0], self.scale[1])
 
+        self.stats = character_stats(self.name)
+        self.last_basic_attack_time = 0
         self.last_special_attack_time = 0
-        self.special_attack_cooldown = 10000
-        self.basic_attack_damage = 10
-        self.attack_range = 150
         self.is_attacking = False
         self.is_special_attacking = False
         self.facing_right = False
 
-        if self.name == 'Lucario':
-            self.special_attack_damage = 25
-            self.attack_range = 200
-        elif self.name == 'Mewtwo':
-            self.special_attack_damage = 30
-            self.attack_range = 300
-        elif self.name == 'Zeraora':
-            self.special_attack_damage = 20
-            self.attack_range = 150
-            self.special_attack_cooldown = 2000
-        elif self.name == 'Cinderace':
-            self.special_attack_damage = 22
-            self.attack_range = 250
-
     def load_sprite(self):
+        return sprite_cache.get(self.name, self.scale)
 
-        character_colors = {
-            'Lucario': (0, 0, 255),
-            'Mewtwo': (255, 0, 255),
-            'Zeraora': (255, 255, 0),
-            'Cinderace': (255, 0, 0)
-        }
-
-        try:
-            sprite_path = f"sprites/{self.name.lower()}_sprite.png"
-            img = pygame.image.load(sprite_path).convert_alpha()
-            return pygame.transform.scale(img, self.scale)
-
-        except Exception as e:
-            print(f"Error loading sprite for {self.name}: {str(e)}")
-
-            surface = pygame.surface.Surface(self.scale)
-            color = character_colors.get(self.name, (255, 0, 0))
-            surface.fill(color)
-            return surface
-
-    def check_platform_collision(self, platforms):
+    def check_platform_collision(self, platform_index):
         self.rect.x = self.x - self.scale[0] // 2
         self.rect.y = self.y - self.scale[1]
 
         if self.velocity_y > 0:
-            for platform in platforms:
-                if self.rect.right >= platform.x and self.rect.left <= platform.x + platform.width:
-                    current_bottom = self.rect.bottom
-
-                    if abs(current_bottom - platform.y) <= abs(self.velocity_y + self.gravity) + 1:
-                        self.y = platform.y
-                        self.velocity_y = 0
-                        self.is_jumping = False
-                        self.on_platform = True
-                        return True
-
-                    elif self.velocity_y > 0 and current_bottom >= platform.y and current_bottom <= platform.y + platform.height:
-                        self.y = platform.y
-                        self.velocity_y = 0
-                        self.is_jumping = False
-                        self.on_platform = True
-                        return True
+            current_bottom = self.rect.bottom
+            tolerance = abs(self.velocity_y + self.gravity) + 1
+            nearby = platform_index.between(self.rect.left, self.rect.right,
+                                            current_bottom - max(tolerance, platform_index.max_height),
+                                            current_bottom + tolerance)
+            for platform in nearby:
+                if abs(current_bottom - platform.y) <= tolerance:
+                    self.y = platform.y
+                    self.velocity_y = 0
+                    self.is_jumping = False
+                    self.on_platform = True
+                    return True
+
+                elif self.velocity_y > 0 and current_bottom >= platform.y and current_bottom <= platform.y + platform.height:
+                    self.y = platform.y
+                    self.velocity_y = 0
+                    self.is_jumping = False
+                    self.on_platform = True
+                    return True
 
         self.on_platform = False
         return False
@@ -111,43 +81,32 @@ class Character:
         pygame.draw.rect(screen, (0, 0, 0),
                          (bar_x, bar_y, self.health_bar_width, self.health_bar_height), 1)
 
-    def perform_basic_attack(self, other_character):
-        if other_character and not self.is_dead and not other_character.is_dead:
-            distance = abs(self.x - other_character.x)
-
-            is_target_right = other_character.x > self.x
-            if distance <= self.attack_range and self.facing_right == is_target_right:
-                other_character.take_damage(self.basic_attack_damage)
-                self.is_attacking = True
-                return True
+    def perform_basic_attack(self, other_character, current_time):
+        attack = self.stats.basic_attack
+        if current_time - self.last_basic_attack_time >= attack.cooldown * 1000 and self.hit(other_character, attack):
+            self.last_basic_attack_time = current_time
+            self.is_attacking = True
+            return True
         return False
 
     def perform_special_attack(self, other_character, current_time):
+        attack = self.stats.special_attack
+        if current_time - self.last_special_attack_time >= attack.cooldown * 1000 and self.hit(other_character, attack):
+            self.last_special_attack_time = current_time
+            self.is_special_attacking = True
+            return True
+        return False
+
+    def hit(self, other_character, attack):
         if other_character and not self.is_dead and not other_character.is_dead:
-            if current_time - self.last_special_attack_time >= self.special_attack_cooldown:
-                distance = abs(self.x - other_character.x)
-                is_target_right = other_character.x > self.x
-
-                if distance <= self.attack_range and self.facing_right == is_target_right:
-                    damage = self.special_attack_damage
-                    if self.name == 'Lucario':
-                        # Aura Sphere - More damage at lower health
-                        damage = self.special_attack_damage * (1+ (1 - self.current_health/self.max_health))
-                    elif self.name == 'Mewtwo':
-                        # Psystrike - Ignores distance penalty
-                        damage = self.special_attack_damage
-                    elif self.name == 'Zeraora':
-                        # Plasma Fists - Chain lightning effect
-                        damage = self.special_attack_damage
-                        other_character.velocity_x = 10 if is_target_right else -10
-                    elif self.name == 'Cinderace':
-                        # Pyro Ball - More damage at longer range
-                        damage = self.special_attack_damage * (1 + distance/self.attack_range)
-
-                    other_character.take_damage(damage)
-                    self.last_special_attack_time = current_time
-                    self.is_special_attacking = True
-                    return True
+            distance = abs(self.x - other_character.x)
+            is_target_right = other_character.x > self.x
+
+            if distance <= attack.range and self.facing_right == is_target_right:
+                other_character.take_damage(attack.damage_for(self.current_health / self.max_health, distance))
+                if attack.knockback:
+                    other_character.velocity_x = attack.knockback if is_target_right else -attack.knockback
+                return True
         return False
 
     def take_damage(self, damage):
@@ -163,7 +122,7 @@ class Character:
             return True
         return False
 
-    def move(self, keys, platforms, player_num=1):
+    def move(self, keys, platform_index, player_num=1):
         #forward and backward movement
         if player_num == 1:
             left_key = pygame.K_q
@@ -195,7 +154,7 @@ class Character:
         self.velocity_y += self.gravity
         self.y += self.velocity_y
 
-        if not self.check_platform_collision(platforms):
+        if not self.check_platform_collision(platform_index):
             if self.y >= self.ground_y:
                 self.y = self.ground_y
                 self.velocity_y = 0
@@ -209,8 +168,9 @@ class Character:
 
     def draw(self, screen):
         if self.sprite:
-            screen.blit(self.sprite, (self.x - self.sprite.get_width()//2,
-                                      self.y - self.sprite.get_height()))
+            sprite = sprite_cache.facing(self.sprite, self.facing_right)
+            screen.blit(sprite, (self.x - sprite.get_width()//2,
+                                 self.y - sprite.get_height()))
             self.draw_health_bar(screen)
 
 
@@ -225,19 +185,19 @@ class CharacterManager:
         else:
             self.player2 = Character(character_name, 700, 580)
 
-    def update(self, keys, platforms, current_time):
+    def update(self, keys, platform_index, current_time):
 
         if self.player1:
-            self.player1.move(keys, platforms, 1)
+            self.player1.move(keys, platform_index, 1)
             if keys[pygame.K_f]:
-                self.player1.perform_basic_attack(self.player2)
+                self.player1.perform_basic_attack(self.player2, current_time)
             elif keys[pygame.K_g]:
                 self.player1.perform_special_attack(self.player2, current_time)
 
         if self.player2:
-            self.player2.move(keys, platforms, 2)
+            self.player2.move(keys, platform_index, 2)
             if keys[pygame.K_k]:
-                self.player2.perform_basic_attack(self.player1)
+                self.player2.perform_basic_attack(self.player1, current_time)
             elif keys[pygame.K_l]:
                 self.player2.perform_special_attack(self.player1, current_time)
 
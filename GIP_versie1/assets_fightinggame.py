@@ -0,0 +1,64 @@
+import threading
+
+import pygame
+
+CHARACTER_COLORS = {
+    'Lucario': (0, 0, 255),
+    'Mewtwo': (255, 0, 255),
+    'Zeraora': (255, 255, 0),
+    'Cinderace': (255, 0, 0)
+}
+SPRITE_PATH = 'sprites/{name}_sprite.png'
+
+
+class SpriteCache:
+    # Every sprite is read from disk once per process and every scale is
+    # converted once, drawing code only picks a ready surface. The sprite
+    # art faces left, facing_right uses a mirrored copy.
+    def __init__(self, sprite_path=SPRITE_PATH):
+        self.sprite_path = sprite_path
+        self.images = {}
+        self.sprites = {}
+        self.mirrored = {}
+        self.lock = threading.RLock()
+
+    def load_image(self, name):
+        if name not in self.images:
+            try:
+                self.images[name] = pygame.image.load(self.sprite_path.format(name=name.lower())).convert_alpha()
+            except Exception as e:
+                print(f'Error loading sprite for {name}: {str(e)}')
+                self.images[name] = None
+        return self.images[name]
+
+    def get(self, name, scale=(100, 100), facing_right=False):
+        with self.lock:
+            sprite = self.sprites.get((name, scale))
+            if sprite is None:
+                image = self.load_image(name)
+                if image is None:
+                    # The colored block is only built for characters whose sprite is missing
+                    sprite = pygame.Surface(scale)
+                    sprite.fill(CHARACTER_COLORS.get(name, (255, 0, 0)))
+                    sprite = sprite.convert()
+                else:
+                    sprite = pygame.transform.scale(image, scale)
+                self.sprites[(name, scale)] = sprite
+            return self.facing(sprite, facing_right)
+
+    def facing(self, sprite, facing_right):
+        if not facing_right:
+            return sprite
+        with self.lock:
+            mirrored = self.mirrored.get(sprite)
+            if mirrored is None:
+                mirrored = self.mirrored[sprite] = pygame.transform.flip(sprite, True, False)
+            return mirrored
+
+    def preload(self, names, scale=(100, 100)):
+        for name in names:
+            self.get(name, scale, False)
+            self.get(name, scale, True)
+
+
+sprite_cache = SpriteCache()
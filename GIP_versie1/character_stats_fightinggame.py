@@ -0,0 +1,74 @@
+import json
+import os
+
+STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'character_stats.json')
+
+
+def no_scaling(attack, health_fraction, distance):
+    return attack.damage
+
+
+def missing_health_scaling(attack, health_fraction, distance):
+    # Aura Sphere, more damage the lower the attacker's health
+    return attack.damage * (2 - health_fraction)
+
+
+def distance_scaling(attack, health_fraction, distance):
+    # Pyro Ball, more damage at longer range
+    return attack.damage * (1 + distance / attack.range)
+
+
+SCALING = {
+    'none': no_scaling,
+    'missing_health': missing_health_scaling,
+    'distance': distance_scaling
+}
+
+
+class Attack:
+    # The scaling name from the table is looked up once here, working out
+    # the damage of a hit is then a single call whatever the character.
+    __slots__ = ('damage', 'range', 'cooldown', 'knockback', 'scaling')
+
+    def __init__(self, damage, range, cooldown, knockback=0, scaling='none'):
+        self.damage = damage
+        self.range = range
+        self.cooldown = cooldown
+        self.knockback = knockback
+        self.scaling = SCALING[scaling]
+
+    def damage_for(self, health_fraction, distance):
+        return self.scaling(self, health_fraction, distance)
+
+
+class CharacterStats:
+    __slots__ = ('name', 'basic_attack', 'special_attack')
+
+    def __init__(self, name, basic_attack, special_attack):
+        self.name = name
+        self.basic_attack = basic_attack
+        self.special_attack = special_attack
+
+    def attack(self, special):
+        return self.special_attack if special else self.basic_attack
+
+
+def load_characters(path=STATS_PATH):
+    """Reads the character table, returns the characters by name and the stats for an unknown character."""
+    with open(path) as stats_file:
+        table = json.load(stats_file)
+
+    basic_attack = Attack(**table['basic_attack'])
+    characters = {}
+    for name, definition in table['characters'].items():
+        characters[name] = CharacterStats(name, Attack(**definition.get('basic_attack', table['basic_attack'])),
+                                          Attack(**definition['special_attack']))
+    default = CharacterStats(None, basic_attack, Attack(**table['default_special_attack']))
+    return characters, default
+
+
+CHARACTERS, DEFAULT_CHARACTER = load_characters()
+
+
+def character_stats(name):
+    return CHARACTERS.get(name, DEFAULT_CHARACTER)
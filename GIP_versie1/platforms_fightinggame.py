@@ -0,0 +1,35 @@
+from bisect import bisect_left, bisect_right
+
+
+class PlatformIndex:
+    # Platforms are bucketed in vertical columns of cell_size pixels and kept
+    # sorted by height inside a column, a collision check then only looks at
+    # the platforms in the character's columns around its feet.
+    def __init__(self, platforms, cell_size=100):
+        self.platforms = list(platforms)
+        self.cell_size = cell_size
+        self.cells = {}
+        self.lowest_y = max((platform.y for platform in self.platforms), default=float('inf'))
+        self.max_height = max((platform.height for platform in self.platforms), default=0)
+
+        for platform in sorted(self.platforms, key=lambda platform: platform.y):
+            for column in range(self.cell(platform.x), self.cell(platform.x + platform.width) + 1):
+                platforms_in_cell, heights = self.cells.setdefault(column, ([], []))
+                platforms_in_cell.append(platform)
+                heights.append(platform.y)
+
+    def cell(self, x):
+        return int(x // self.cell_size)
+
+    def between(self, left, right, top, bottom):
+        """Returns the platforms touching left..right with top <= y <= bottom, highest first."""
+        found = {}
+        for column in range(self.cell(left), self.cell(right) + 1):
+            if column not in self.cells:
+                continue
+            platforms, heights = self.cells[column]
+            for index in range(bisect_left(heights, top), bisect_right(heights, bottom)):
+                platform = platforms[index]
+                if right >= platform.x and left <= platform.x + platform.width:
+                    found[id(platform)] = platform
+        return sorted(found.values(), key=lambda platform: platform.y)
@@ -1,6 +1,7 @@
 import pygame
 from pygame.locals import *
 from Characters_fightinggame import CharacterManager
+from platforms_fightinggame import PlatformIndex
 import sys
 
 def create_sprite_surface(width, height):
@@ -44,6 +45,7 @@ class Stadium:
         self.player2 = None
 
         self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+        self.background = None
         pygame.display.set_caption("Fighting game stadium")
         self.clock = pygame.time.Clock()
 
@@ -60,16 +62,25 @@ class Stadium:
         self.small_font = pygame.font.Font(None, 36)
 
     def draw_background(self):
-        for y in range(self.SCREEN_HEIGHT):
+        # The backdrop never changes, so it is rendered once and only blitted per frame
+        if self.background is None or self.background.get_size() != self.screen.get_size():
+            self.background = self.render_background(self.screen.get_size())
+        self.screen.blit(self.background, (0, 0))
+
+    def render_background(self, size):
+        width, height = size
+        background = pygame.Surface(size).convert()
+        for y in range(height):
             color = (
-                self.DARK_BLUE[0] + (self.BLUE[0] - self.DARK_BLUE[0]) * y // self.SCREEN_HEIGHT,
-                self.DARK_BLUE[1] + (self.BLUE[1] - self.DARK_BLUE[1]) * y // self.SCREEN_HEIGHT,
-                self.DARK_BLUE[2] + (self.BLUE[2] - self.DARK_BLUE[2]) * y // self.SCREEN_HEIGHT
+                self.DARK_BLUE[0] + (self.BLUE[0] - self.DARK_BLUE[0]) * y // height,
+                self.DARK_BLUE[1] + (self.BLUE[1] - self.DARK_BLUE[1]) * y // height,
+                self.DARK_BLUE[2] + (self.BLUE[2] - self.DARK_BLUE[2]) * y // height
             )
-            pygame.draw.line(self.screen, color, (0, y), (self.SCREEN_WIDTH, y))
+            pygame.draw.line(background, color, (0, y), (width, y))
 
-        pygame.draw.polygon(self.screen, self.GRAY, [(0, self.SCREEN_HEIGHT), (300, 500), (500, self.SCREEN_HEIGHT)])
-        pygame.draw.polygon(self.screen, self.GRAY, [(500, self.SCREEN_HEIGHT), (700, 400), (900, self.SCREEN_HEIGHT)])
+        pygame.draw.polygon(background, self.GRAY, [(0, height), (300, 500), (500, height)])
+        pygame.draw.polygon(background, self.GRAY, [(500, height), (700, 400), (900, height)])
+        return background
 
     def draw_platform(self):
         platform_width1 = 600
@@ -107,6 +118,7 @@ class Stadium:
             Platform(platform_x2, platform_y2, platform_width2, platform_height),
             Platform(platform_x3, platform_y3, platform_width2, platform_height)
         ]
+        self.platform_index = PlatformIndex(self.platforms)
     def draw_game_over_screen(self):
         overlay = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
         overlay.fill(self.BLACK)
@@ -145,7 +157,7 @@ class Stadium:
                     running = False
 
             keys = pygame.key.get_pressed()
-            self.character_manager.update(keys, self.platforms, current_time)
+            self.character_manager.update(keys, self.platform_index, current_time)
 
             self.screen.fill(self.BLACK)
             self.draw_background()
@@ -3,6 +3,7 @@ import pygame_menu
 import os
 import sys
 from stadium_fightinggame import Stadium
+from assets_fightinggame import sprite_cache
 
 
 class GameMenu:
@@ -26,10 +27,12 @@ class GameMenu:
 
     def set_character_p1(self, selected_value, _):
         self.player1_character = selected_value[0][0]
+        sprite_cache.preload([self.player1_character])
         print(f'Player 1 character selected: {self.player1_character}')
 
     def set_character_p2(self, selected_value, _):
         self.player2_character = selected_value[0][0]
+        sprite_cache.preload([self.player2_character])
         print(f'Player 2 character selected: {self.player2_character}')
 
     def add_baseimage(self, image_path, scale=(50, 50)):
@@ -24,7 +24,6 @@ class GameServer:
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.clients = {}
-        self.logger.info(f'Clients: {self.clients}')
         self.client_characters = {}
         self.game_state = {
             'players': {},
@@ -109,7 +108,8 @@ class GameServer:
                 if not data:
                     break
                 client_data = pickle.loads(data)
-                self.logger.info(f'client data: {client_data}')
+                # Every message passes here, the arguments are only formatted when DEBUG is on
+                self.logger.debug('client data: %s', client_data)
 
                 #if 'action' in client_data:
                     #if client_data['action'] == 'login':
@@ -190,10 +190,8 @@ class GameServer:
 
     def send_heartbeats(self, client_socket, player_num):
         while player_num in self.clients:
-            self.logger.info(f'self.clients: {self.clients}')
             try:
                 client_socket.send(pickle.dumps({'status': 'heartbeat'}))
-                self.logger.info(f'client socket: {client_socket}')
                 time.sleep(1)
             except Exception as e:
                 self.logger.info(f'Heartbeat failed for player{player_num}: {str(e)}')
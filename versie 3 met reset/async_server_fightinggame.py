@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+from network_fightinggame import AsyncFramedConnection, ProtocolError
+from server_fightinggame import GameServer
+from telemetry_fightinggame import telemetry, install_dump_signal
+
+
+class GameDatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, address):
+        self.server.handle_datagram(data, address)
+
+
+class AsyncGameServer(GameServer):
+    def __init__(self, host='0.0.0.0', port=5555, max_rooms=500, tick_rate=60, broadcast_rate=60,
+                 heartbeat_interval=1.0, udp=True, vector_physics=False, stats_port=None, record_dir=None):
+        super().__init__(host, port, max_rooms, tick_rate, broadcast_rate, udp, vector_physics, heartbeat_interval,
+                         stats_port, record_dir)
+        self.datagram_transport = None
+
+    def start(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self.logger.error(f'Error starting server: {str(e)}')
+        finally:
+            self.close_server()
+
+    async def serve(self):
+        self.open_listener(backlog=128)
+        self.server_socket.setblocking(False)
+        server = await asyncio.start_server(self.accept_client, sock=self.server_socket)
+        if self.udp_socket:
+            self.udp_socket.setblocking(False)
+            self.datagram_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: GameDatagramProtocol(self), sock=self.udp_socket)
+
+        tick_task = asyncio.create_task(self.run_ticks())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            tick_task.cancel()
+            if self.datagram_transport:
+                self.datagram_transport.close()
+
+    def send_datagram(self, data, address):
+        self.datagram_transport.sendto(data, address)
+
+    async def accept_client(self, reader, writer):
+        address = writer.get_extra_info('peername')
+        connection = AsyncFramedConnection(reader, writer)
+        assignment = self.add_client(connection, address)
+        if assignment is None:
+            return
+
+        room, player_num = assignment
+        try:
+            while True:
+                messages = await connection.receive_async()
+                if messages is None:
+                    break
+                for client_data in messages:
+                    self.handle_message(room, player_num, client_data)
+
+        except ProtocolError as e:
+            self.logger.info(f'Protocol error from player {player_num}: {str(e)}')
+        except (ConnectionError, OSError) as e:
+            self.logger.info(f'Connection lost to player {player_num}: {str(e)}')
+        except Exception as e:
+            self.logger.info(f'Error handling client {player_num}:{str(e)}')
+            try:
+                connection.send({'status': 'server_error', 'message': f'Server error: {str(e)}'})
+            except Exception:
+                pass
+        finally:
+            self.handle_disconnect(room, player_num)
+
+    async def run_ticks(self):
+        # Everything that touches game_state runs on the event loop, so no locking is needed
+        next_heartbeat = time.time()
+        while True:
+            steps = self.clock.due_steps(time.perf_counter())
+            current_time = time.time()
+            if steps:
+                self.tick(current_time, steps)
+
+            if current_time >= next_heartbeat:
+                self.send_heartbeat_to_all(current_time)
+                next_heartbeat = current_time + self.heartbeat_interval
+
+            await asyncio.sleep(self.clock.time_until_next(time.perf_counter()))
+
+
+if __name__ == "__main__":
+    server = AsyncGameServer(stats_port=5556)
+    telemetry.enable_sink()
+    install_dump_signal('telemetry_server.bin')
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        server.logger.info('Server stopped by user')
+        server.close_server()
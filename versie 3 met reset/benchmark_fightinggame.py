@@ -0,0 +1,205 @@
+import pickle
+import random
+import time
+import timeit
+
+from codec_fightinggame import SnapshotEncoder, SnapshotDecoder
+from network_fightinggame import HEADER
+from simulation_fightinggame import PlatformIndex, PlayerState, overlaps, step_player
+from physics_fightinggame import VectorPhysics, VECTOR_PHYSICS_AVAILABLE
+
+
+def sample_game_state():
+    game_state = {
+        'players': {},
+        'ready': 2,
+        'platforms': [
+            {'x': 200, 'y': 600, 'width': 600, 'height': 20},
+            {'x': 400, 'y': 300, 'width': 100, 'height': 20},
+            {'x': 600, 'y': 450, 'width': 100, 'height': 20}
+        ]
+    }
+    for player_num in (1, 2):
+        game_state['players'][player_num] = {
+            'connected': True,
+            'character': 'Lucario' if player_num == 1 else 'Mewtwo',
+            'x': 312.5 if player_num == 1 else 688.0,
+            'y': 580,
+            'health': 72.5,
+            'is_dead': False,
+            'is_attacking': player_num == 1,
+            'is_special_attacking': False,
+            'facing_right': player_num == 2,
+            'velocity_y': -3.2,
+            'is_jumping': True
+        }
+    return game_state
+
+
+def player_state(player_num, values):
+    player = PlayerState(player_num)
+    player.update(values)
+    return player
+
+
+def sample_players(game_state):
+    return {player_num: player_state(player_num, player_data)
+            for player_num, player_data in game_state['players'].items()}
+
+
+def measure(label, func, number):
+    seconds = timeit.timeit(func, number=number)
+    print(f'  {label:<28}{seconds / number * 1e6:8.2f} us')
+
+
+def benchmark_state_codec(number=20000):
+    game_state = sample_game_state()
+    players = sample_players(game_state)
+    timestamp = time.time()
+
+    def pickle_state():
+        state = game_state.copy()
+        state['timestamp'] = timestamp
+        return pickle.dumps(state)
+
+    encoder = SnapshotEncoder()
+    encoder.capture(players, timestamp)
+    full = encoder.encode()
+    players[1].x += 5
+    encoder.capture(players, timestamp)
+    one_field = encoder.encode(1)
+    encoder.capture(players, timestamp)
+    idle = encoder.encode(2)
+
+    pickled = pickle_state()
+    print('Per-tick state message (two players)')
+    print(f'  {"pickle bytes/tick":<28}{len(pickled) + HEADER.size:8d}')
+    print(f'  {"full snapshot bytes/tick":<28}{len(full) + HEADER.size:8d}')
+    print(f'  {"one x changed bytes/tick":<28}{len(one_field) + HEADER.size:8d}')
+    print(f'  {"idle bytes/tick":<28}{len(idle) + HEADER.size:8d}')
+    measure('pickle.dumps', pickle_state, number)
+    measure('pickle.loads', lambda: pickle.loads(pickled), number)
+
+    def encode_full():
+        encoder.capture(players, timestamp)
+        return encoder.encode()
+
+    def encode_delta():
+        baseline = encoder.sequence
+        encoder.capture(players, timestamp)
+        return encoder.encode(baseline)
+
+    measure('encode full snapshot', encode_full, number)
+    measure('encode delta snapshot', encode_delta, number)
+
+    decoder = SnapshotDecoder()
+    measure('decode full snapshot', lambda: decoder.decode(full), number)
+
+
+def benchmark_platforms(count=500, number=20000):
+    generator = random.Random(1)
+    platforms = [{'x': generator.uniform(0, 4000), 'y': generator.uniform(100, 3000),
+                  'width': generator.uniform(60, 400), 'height': 20} for _ in range(count)]
+    index = PlatformIndex(platforms)
+    queries = [(generator.uniform(0, 4000), generator.uniform(100, 3000), generator.uniform(5, 40))
+               for _ in range(256)]
+
+    def linear_landing(x, previous_y, y):
+        landing = None
+        for platform in platforms:
+            if overlaps(platform, x) and previous_y <= platform['y'] <= y:
+                if landing is None or platform['y'] < landing['y']:
+                    landing = platform
+        return landing
+
+    for x, y, fall in queries:
+        assert index.landing(x, y, y + fall) is linear_landing(x, y, y + fall)
+
+    def run(landing):
+        def queries_run():
+            for x, y, fall in queries:
+                landing(x, y, y + fall)
+        return queries_run
+
+    print(f'Landing query, {count} platforms')
+    measure('linear scan', lambda: linear_landing(*queries[0][:2], queries[0][1] + queries[0][2]), number)
+    measure('platform index', lambda: index.landing(*queries[0][:2], queries[0][1] + queries[0][2]), number)
+    measure('256 queries linear', run(linear_landing), number // 256)
+    measure('256 queries index', run(index.landing), number // 256)
+
+
+def benchmark_physics(count=1000, number=50):
+    if not VECTOR_PHYSICS_AVAILABLE:
+        print('Physics step skipped, numpy is not installed')
+        return
+
+    index = PlatformIndex(sample_game_state()['platforms'])
+    generator = random.Random(3)
+    players = [{'x': generator.uniform(50, 950), 'y': generator.choice([300, 450, 600, generator.uniform(0, 650)]),
+                'velocity_y': generator.uniform(-900, 900), 'is_jumping': False, 'facing_right': False}
+               for _ in range(count)]
+    inputs = [{'move': generator.choice([-1, 0, 1]), 'jump': generator.random() < 0.1} for _ in range(count)]
+    physics = VectorPhysics()
+    dt = 1 / 60
+
+    scalar = [player_state(1, player) for player in players]
+    vector = [player_state(1, player) for player in players]
+    for _ in range(30):
+        for player, entry in zip(scalar, inputs):
+            step_player(player, entry, index, dt)
+        physics.step_players([(player, entry, index) for player, entry in zip(vector, inputs)], dt)
+    error = max(abs(a[field] - b[field]) for a, b in zip(scalar, vector) for field in ('x', 'y', 'velocity_y'))
+
+    print(f'Physics step, {count} players (max difference after 30 steps {error:.2e})')
+    measure('step_player loop', lambda: [step_player(player, entry, index, dt)
+                                         for player, entry in zip(scalar, inputs)], number)
+    movers = [(player, entry, index) for player, entry in zip(vector, inputs)]
+    measure('VectorPhysics.step_players', lambda: physics.step_players(movers, dt), number)
+
+
+def benchmark_frame(number=300):
+    # pygame is only needed for this part, the dummy driver keeps it headless
+    import os
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    from client_fightinggame import GameClient
+
+    client = GameClient()
+    client.state_buffer.publish(sample_game_state())
+    client.init_platforms()
+    size = client.screen.get_size()
+
+    def uncached_frame():
+        client.screen.fill(client.BLACK)
+        client.screen.blit(client.render_background(size), (0, 0))
+        client.draw_platforms()
+
+    def cached_frame():
+        client.screen.fill(client.BLACK)
+        client.draw_background()
+        client.draw_platforms()
+
+    sprite = client.create_character_sprite('Lucario')
+    players = client.game_state['players']
+    drawables = [client.character_drawable(player_num, player, sprite) for player_num, player in players.items()]
+
+    def idle_dirty_frame():
+        pygame.display.update(client.draw_match(drawables))
+
+    def moving_dirty_frame():
+        players[1]['x'] = 300 + (players[1]['x'] + 3) % 400
+        pygame.display.update(client.draw_match([client.character_drawable(1, players[1], sprite), drawables[1]]))
+
+    print(f'Background and platforms, {size[0]}x{size[1]}')
+    measure('render every frame', uncached_frame, number)
+    measure('cached background', cached_frame, number)
+    measure('dirty rects, idle', idle_dirty_frame, number)
+    measure('dirty rects, one moving', moving_dirty_frame, number)
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    benchmark_state_codec()
+    benchmark_platforms()
+    benchmark_physics()
+    benchmark_frame()
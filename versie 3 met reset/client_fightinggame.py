@@ -1,6 +1,5 @@
 import pygame
 import socket
-import pickle
 import threading
 import sys
 import time
@@ -8,9 +7,20 @@ import logging
 
 from jinja2.nodes import Continue
 from pygame.locals import *
+from collections import deque
+from network_fightinggame import (FramedConnection, ProtocolError, DatagramChannel, RttEstimator, decode_datagram,
+                                  MAX_DATAGRAM_SIZE, KIND_SNAPSHOT)
+from character_stats_fightinggame import CHARACTERS, character_stats
+from simulation_fightinggame import FixedTimestep, PlatformIndex, PlayerState, step_player
+from interpolation_fightinggame import SnapshotBuffer, MAX_INTERPOLATION_DELAY
+from render_fightinggame import DirtyRectRenderer
+from assets_fightinggame import sprite_cache
+from telemetry_fightinggame import telemetry
+from profiler_fightinggame import FrameProfiler
+from gamestate_fightinggame import GameStateBuffer
 
 class GameClient:
-    def __init__(self, host='localhost', port=5555):
+    def __init__(self, host='localhost', port=5555, use_udp=True, record_telemetry=False):
         logging.basicConfig(level=logging.INFO,
                             format='%(asctime)s [CLIENT] %(message)s',
                             datefmt='%H:%M:%S')
@@ -20,6 +30,11 @@ class GameClient:
         self.host = host
         self.port = port
         self.client_socket = None
+        self.connection = None
+        self.use_udp = use_udp
+        self.udp_socket = None
+        self.datagram_channel = None
+        self.udp_ready = False
         self.player_num = None
         self.character_name = None
         self.opponent_character = None
@@ -32,6 +47,11 @@ class GameClient:
         self.SCREEN_WIDTH = 1000
         self.SCREEN_HEIGHT = 650
         self.screen = pygame.display.set_mode((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
+        self.background = None
+        self.scene = None
+        # Redraw and update only what moved during a match instead of flipping the whole screen
+        self.dirty_rendering = True
+        self.renderer = DirtyRectRenderer(self.screen)
         pygame.display.set_caption("Pokemon Fighting Game - Client")
         self.clock = pygame.time.Clock()
 
@@ -47,29 +67,54 @@ class GameClient:
         self.font = pygame.font.Font(None, 74)
         self.small_font = pygame.font.Font(None, 36)
 
-        self.game_state = {
-            'players':{},
-            'platforms':[]
-        }
+        # Written by the network threads, the render loop only ever reads the published state
+        self.state_buffer = GameStateBuffer()
         self.platforms = []
+        self.platform_index = PlatformIndex([])
         self.ready = False
 
-        self.available_characters = ['Lucario', 'Mewtwo', 'Zeraora', 'Cinderace']
+        self.available_characters = list(CHARACTERS)
         self.selected_character_index = 0
 
         self.character_sprite = None
         self.opponent_sprite = None
+        self.sprites = sprite_cache
 
-        self.heartbeat_thread = None
+        # The server sends a heartbeat when it has nothing else to send, so any data counts as a sign of life
         self.last_server_response = time.time()
-        self.heartbeat_timeout = 1000
+        self.heartbeat_timeout = 5
         self.server_error = False
         self.error_message = None
 
         self.reset_requested = False
         self.predicted_player_state = None
-        self.is_jumping = False
-        self.jump_velocity = 0
+        self.simulation_rate = 60
+        self.last_snapshot_sequence = None
+        self.interpolation_delay = 0.1
+        self.opponent_snapshots = SnapshotBuffer(delay=self.interpolation_delay)
+        # The round trip is measured from the server echoing the newest input it applied
+        self.rtt = RttEstimator()
+        self.input_send_times = deque()
+
+        # Per-frame state only goes to the log at DEBUG level and at most once a second.
+        # The ring buffer that keeps the numbers of the last frames for a dump with F9
+        # costs a record per frame, so it only runs with record_telemetry or after a first F9
+        self.frame_telemetry = telemetry.channel('client.frames', self.logger, max_per_second=1)
+        self.telemetry_dump_path = 'telemetry_client.bin'
+        if record_telemetry:
+            telemetry.enable_sink()
+
+        # Every match frame is split into stages, F3 shows them over the game and F4 writes them to a CSV file
+        self.profiler = FrameProfiler()
+        self.show_profiler = False
+        self.profiler_font = pygame.font.SysFont('consolas,dejavusansmono,monospace', 15)
+        self.profiler_surface = None
+        self.profiler_refresh = 0
+        self.frame_trace_path = 'frame_trace.csv'
+
+    @property
+    def game_state(self):
+        return self.state_buffer.front
 
     def connect_to_server(self):
         try:
@@ -77,19 +122,17 @@ class GameClient:
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_socket.settimeout(5)
             self.client_socket.connect((self.host, self.port))
-            self.client_socket.settimeout(None)
+            self.client_socket.settimeout(self.heartbeat_timeout)
 
-            data = self.client_socket.recv(4096)
-            response = pickle.loads(data)
+            self.connection = FramedConnection(self.client_socket)
+            response = self.connection.next_message()
+            if response is None:
+                raise ConnectionError('Server closed the connection')
 
             if response['status'] == 'connected':
                 self.player_num = response['player_num']
                 self.connected = True
-                self.logger.info(f'Connected to server as Player {self.player_num}')
-
-                self.heartbeat_thread = threading.Thread(target=self.check_server_heartbeat)
-                self.heartbeat_thread.daemon = True
-                self.heartbeat_thread.start()
+                self.logger.info(f'Connected to server as Player {self.player_num} in room {response.get("room", 1)}')
 
                 receive_thread = threading.Thread(target=self.receive_data)
                 receive_thread.daemon = True
@@ -126,23 +169,12 @@ class GameClient:
             self.error_message = f"Connection error: {str(e)}"
             return False
 
-    def check_server_heartbeat(self):
-        while self.connected:
-            if time.time() - self.last_server_response > self.heartbeat_timeout:
-                self.logger.info("Server heartbeat timeout - no response")
-                self.server_error = True
-                self.error_message = "Server connection lost: No response"
-                self.connected = False
-            time.sleep(1)
-
     def receive_data(self):
-        buffer_size = 8192
-
         while self.connected:
             try:
-                data = self.client_socket.recv(buffer_size)
+                messages = self.connection.receive()
 
-                if not data:
+                if messages is None:
                     self.logger.info("Empty data received from server - disconnected")
                     self.server_error = True
                     self.error_message = "Server disconnected"
@@ -151,78 +183,24 @@ class GameClient:
 
                 self.last_server_response = time.time()
 
-                try:
-                    response = pickle.loads(data)
-
-                    if 'status' in response:
-                        if response['status'] == 'match_start':
-                            self.match_started = True
-                            self.game_state = response['game_state']
-                            self.init_platforms()
-                        elif response['status'] == 'game_over':
-                            self.logger.info(f'Game over received with winner: {response.get('winner')}')
-                            self.game_over = True
-                            self.winner = response.get('winner')
-                            if 'game_state' in response:
-                                self.game_state = response['game_state']
-                        elif response['status'] == 'server_error':
-                            self.server_error = True
-                            self.error_message = response.get('message', "Server reported an error")
-                            self.logger.info(f'Server error: {self.error_message}')
-                        elif response['status'] == 'heartbeat':
-                            continue
-                        elif response['status'] == 'game_reset':
-                            self.match_started = False
-                            self.game_over = False
-                            self.winner = None
-                            self.ready = False
-                            self.character = None
-
-                            self.predicted_player_state = None
-                            self.current_opponent_state = None
-                            self.is_jumping = False
-                            self.jump_velocity = 0
-
-                            if 'game_state' in response:
-                                self.game_state = response['game_state']
-                            self.logger.info("Game reset received - movement variable reset")
-                            self.reset_requested = True
+                for response in messages:
+                    self.handle_server_message(response)
 
-                    else:
-                        if 'players' in response:
-                            for player_num, player_data in response['players'].items():
-                                if player_num in self.game_state.get('players', {}):
-                                    self.game_state['players'][player_num].update(player_data)
-                                else:
-                                    if 'players' not in self.game_state:
-                                        self.game_state['players'] = {}
-                                    self.game_state['players'][player_num] = player_data
-
-                        if 'platforms' in response and response['platforms'] != self.game_state.get('platforms'):
-                            self.game_state['platforms'] = response['platforms']
-                            self.init_platforms()
-
-                    players = self.game_state.get('players', {})
-                    if isinstance(players, dict):
-                        for player_num, player_data in players.items():
-                            if isinstance(player_data, dict) and player_data.get('is_dead', False):
-                                opponent_num = 1 if int(player_num) == 2 else 2
-                                if not self.game_over:
-                                    self.game_over = True
-                                    self.winner = opponent_num
-                                    self.logger.info(f'Detected game over state! Winner: {self.winner}')
-
-                    opponent_num = 2 if self.player_num == 1 else 1
-                    if (isinstance(self.game_state.get('players', {}), dict) and
-                            opponent_num in self.game_state['players'] and
-                            self.game_state['players'][opponent_num].get('character') and
-                            not self.opponent_character):
-                        self.opponent_character = self.game_state['players'][opponent_num]['character']
-                        self.opponent_sprite = self.create_character_sprite(self.opponent_character)
-
-                except pickle.UnpicklingError as e:
-                    self.logger.info(f'Error unpickling data: {str(e)}')
-                    continue
+            except socket.timeout:
+                # TCP can be quiet while snapshots come in over UDP, only silence on both is a timeout
+                if time.time() - self.last_server_response > self.heartbeat_timeout:
+                    self.logger.info("Server heartbeat timeout - no response")
+                    self.server_error = True
+                    self.error_message = "Server connection lost: No response"
+                    self.connected = False
+                    break
+
+            except ProtocolError as e:
+                self.logger.info(f'Protocol error from server: {str(e)}')
+                self.server_error = True
+                self.error_message = f'Invalid data from server: {str(e)}'
+                self.connected = False
+                break
 
             except (socket.error, ConnectionResetError, ConnectionAbortedError) as e:
                 self.logger.info(f'socket connection error: {str(e)}')
@@ -238,16 +216,180 @@ class GameClient:
                 self.connected = False
                 break
 
+    def handle_server_message(self, response):
+        if 'status' in response:
+            if response['status'] == 'match_start':
+                self.match_started = True
+                self.opponent_snapshots.reset()
+                self.input_send_times.clear()
+                self.state_buffer.publish(response['game_state'])
+                self.init_platforms()
+            elif response['status'] == 'game_over':
+                self.logger.info(f'Game over received with winner: {response.get('winner')}')
+                self.game_over = True
+                self.winner = response.get('winner')
+                if 'game_state' in response:
+                    self.state_buffer.publish(response['game_state'])
+            elif response['status'] == 'server_error':
+                self.server_error = True
+                self.error_message = response.get('message', "Server reported an error")
+                self.logger.info(f'Server error: {self.error_message}')
+            elif response['status'] == 'heartbeat':
+                if 'ping' in response:
+                    self.send_data({'pong': response['ping']})
+                return
+            elif response['status'] == 'udp_offer':
+                if self.use_udp:
+                    self.open_datagram_channel(response['port'], response['token'])
+            elif response['status'] == 'udp_ready':
+                self.udp_ready = True
+                self.logger.info('Server reached over UDP, sending real-time data there')
+            elif response['status'] == 'game_reset':
+                self.match_started = False
+                self.game_over = False
+                self.winner = None
+                self.ready = False
+                self.character = None
+
+                self.predicted_player_state = None
+                self.opponent_snapshots.reset()
+
+                if 'game_state' in response:
+                    self.state_buffer.publish(response['game_state'])
+                self.logger.info("Game reset received - movement variable reset")
+                self.reset_requested = True
+
+        else:
+            if 'sequence' in response:
+                self.realtime_channel().send_ack(response['sequence'])
+                self.last_snapshot_sequence = response['sequence']
+
+            if 'players' in response:
+                if 'last_input' in response['players'].get(self.player_num, {}):
+                    self.measure_round_trip(response['players'][self.player_num]['last_input'])
+
+                state = self.state_buffer.merge(players=response['players'])
+                opponent_num = 2 if self.player_num == 1 else 1
+                if 'timestamp' in response and opponent_num in state['players']:
+                    self.opponent_snapshots.push(response['timestamp'], state['players'][opponent_num], time.time())
+
+            if 'platforms' in response and response['platforms'] != self.game_state.get('platforms'):
+                self.state_buffer.merge(platforms=response['platforms'])
+                self.init_platforms()
+
+        state = self.game_state
+        players = state.get('players', {})
+        if isinstance(players, dict):
+            for player_num, player_data in players.items():
+                if isinstance(player_data, dict) and player_data.get('is_dead', False):
+                    opponent_num = 1 if int(player_num) == 2 else 2
+                    if not self.game_over:
+                        self.game_over = True
+                        self.winner = opponent_num
+                        self.logger.info(f'Detected game over state! Winner: {self.winner}')
+
+        opponent_num = 2 if self.player_num == 1 else 1
+        if (isinstance(players, dict) and
+                opponent_num in players and
+                players[opponent_num].get('character') and
+                not self.opponent_character):
+            self.opponent_character = players[opponent_num]['character']
+            self.opponent_sprite = self.create_character_sprite(self.opponent_character)
+
     def send_data(self, data):
         try:
-            if self.client_socket and self.connected:
-                self.client_socket.send(pickle.dumps(data))
+            if self.connection and self.connected:
+                self.connection.send(data)
         except Exception as e:
             self.logger.info(f'Error sending data: {str(e)}')
             self.server_error = True
             self.error_message = f'Cannot send data to server: {str(e)}'
             self.connected = False
 
+    def realtime_channel(self):
+        if self.udp_ready:
+            return self.datagram_channel
+        return self.connection
+
+    def open_datagram_channel(self, port, token):
+        try:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind(('', 0))
+        except OSError as e:
+            self.logger.info(f'UDP not available, staying on TCP: {str(e)}')
+            self.udp_socket = None
+            return
+
+        self.datagram_channel = DatagramChannel(self.udp_socket.sendto, (self.host, port), token)
+        for target in (self.negotiate_datagrams, self.receive_datagrams):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def negotiate_datagrams(self):
+        # Any datagram with our token tells the server where to send, udp_ready confirms it arrived.
+        # When UDP is blocked the offer simply runs out and everything stays on TCP.
+        for attempt in range(20):
+            if self.udp_ready or not self.connected:
+                return
+            try:
+                self.datagram_channel.send_ack(0)
+            except OSError as e:
+                self.logger.info(f'UDP handshake failed: {str(e)}')
+                return
+            time.sleep(0.25)
+        self.logger.info('No UDP reply from server, staying on TCP')
+
+    def receive_datagrams(self):
+        while self.connected:
+            try:
+                data, address = self.udp_socket.recvfrom(MAX_DATAGRAM_SIZE)
+            except OSError:
+                break
+            try:
+                token, kind, payload = decode_datagram(data)
+            except ProtocolError:
+                continue
+            if token != self.datagram_channel.token or kind != KIND_SNAPSHOT:
+                continue
+
+            self.last_server_response = time.time()
+            message = self.connection.decode_datagram(kind, payload)
+            if message is not None:
+                self.handle_server_message(message)
+
+    def send_input(self, sequence, move, jump):
+        try:
+            if self.connection and self.connected:
+                self.realtime_channel().send_input(sequence, move, jump)
+                self.input_send_times.append((sequence, time.perf_counter()))
+        except Exception as e:
+            self.logger.info(f'Error sending input: {str(e)}')
+            self.server_error = True
+            self.error_message = f'Cannot send data to server: {str(e)}'
+            self.connected = False
+
+    def measure_round_trip(self, last_input):
+        while self.input_send_times and self.input_send_times[0][0] < last_input:
+            self.input_send_times.popleft()
+        if self.input_send_times and self.input_send_times[0][0] == last_input:
+            sequence, sent_time = self.input_send_times.popleft()
+            self.rtt.add(time.perf_counter() - sent_time)
+            # Jitter needs a longer delay to keep a snapshot ahead of the render time
+            self.opponent_snapshots.delay = min(MAX_INTERPOLATION_DELAY, self.interpolation_delay + 2 * self.rtt.jitter)
+
+    def reconcile_prediction(self, predicted_state, server_state, pending_inputs, dt):
+        acknowledged = server_state.get('last_input', 0)
+        while pending_inputs and pending_inputs[0][0] <= acknowledged:
+            pending_inputs.popleft()
+
+        for field in ('x', 'y', 'velocity_y', 'is_jumping', 'facing_right', 'is_dead'):
+            if field in server_state:
+                predicted_state[field] = server_state[field]
+
+        for sequence, inputs in pending_inputs:
+            step_player(predicted_state, inputs, self.platform_index, dt)
+
     def draw_error_popup(self):
         overlay = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
         overlay.fill(self.BLACK)
@@ -290,6 +432,8 @@ class GameClient:
         self.screen.blit(exit_text, exit_rect)
 
     def select_character(self):
+        # Load every sprite now so a character arriving on the network thread never waits for the disk
+        self.sprites.preload(self.available_characters, (100, 100))
         selecting = True
 
         while selecting and self.connected:
@@ -367,54 +511,59 @@ class GameClient:
             self.clock.tick(60)
 
     def draw_background(self):
-        for y in range(self.SCREEN_HEIGHT):
+        # The backdrop never changes, so it is rendered once and only blitted per frame
+        if self.background is None or self.background.get_size() != self.screen.get_size():
+            self.background = self.render_background(self.screen.get_size())
+        self.screen.blit(self.background, (0, 0))
+
+    def render_background(self, size):
+        width, height = size
+        background = pygame.Surface(size).convert()
+        for y in range(height):
             color = (
-                self.DARK_BLUE[0] + (self.BLUE[0] - self.DARK_BLUE[0]) * y // self.SCREEN_HEIGHT,
-                self.DARK_BLUE[1] + (self.BLUE[1] - self.DARK_BLUE[1]) * y // self.SCREEN_HEIGHT,
-                self.DARK_BLUE[2] + (self.BLUE[2] - self.DARK_BLUE[2]) * y // self.SCREEN_HEIGHT
+                self.DARK_BLUE[0] + (self.BLUE[0] - self.DARK_BLUE[0]) * y // height,
+                self.DARK_BLUE[1] + (self.BLUE[1] - self.DARK_BLUE[1]) * y // height,
+                self.DARK_BLUE[2] + (self.BLUE[2] - self.DARK_BLUE[2]) * y // height
             )
-            pygame.draw.line(self.screen, color, (0, y), (self.SCREEN_WIDTH, y))
+            pygame.draw.line(background, color, (0, y), (width, y))
 
-        pygame.draw.polygon(self.screen, self.GRAY, [(0, self.SCREEN_HEIGHT), (300, 500), (500, self.SCREEN_HEIGHT)])
-        pygame.draw.polygon(self.screen, self.GRAY, [(500, self.SCREEN_HEIGHT), (700, 400), (900, self.SCREEN_HEIGHT)])
+        pygame.draw.polygon(background, self.GRAY, [(0, height), (300, 500), (500, height)])
+        pygame.draw.polygon(background, self.GRAY, [(500, height), (700, 400), (900, height)])
+        return background
+
+    def get_scene(self):
+        # Background and platforms do not move during a match, the renderer erases old positions with this
+        if self.scene is None or self.scene.get_size() != self.screen.get_size():
+            self.scene = self.render_background(self.screen.get_size())
+            self.draw_platforms(self.scene)
+            self.renderer.set_scene(self.scene)
+        return self.scene
 
     def init_platforms(self):
+        platforms = self.game_state['platforms']
         self.platforms = []
-        for platform_data in self.game_state['platforms']:
+        for platform_data in platforms:
             platform = type('Platform', (), platform_data)
             self.platforms.append(platform)
+        self.platform_index = PlatformIndex(platforms)
+        self.scene = None
 
-    def draw_platforms(self):
+    def draw_platforms(self, surface=None):
+        if surface is None:
+            surface = self.screen
         for platform in self.platforms:
-            pygame.draw.rect(self.screen, self.DARK_BLUE, (platform.x, platform.y, platform.width, platform.height))
-            pygame.draw.rect(self.screen, self.WHITE, (platform.x, platform.y, platform.width, 5))
+            pygame.draw.rect(surface, self.DARK_BLUE, (platform.x, platform.y, platform.width, platform.height))
+            pygame.draw.rect(surface, self.WHITE, (platform.x, platform.y, platform.width, 5))
 
     def create_character_sprite(self, character_name):
-        character_colors = {
-            'Lucario': (0, 0, 255),
-            'Mewtwo': (255, 0, 255),
-            'Zeraora': (255, 255, 0),
-            'Cinderace': (255, 0, 0)
-        }
-
-        try:
-            sprite = f"sprites/{character_name.lower()}_sprite.png"
-            img = pygame.image.load(sprite).convert_alpha()
-            return pygame.transform.scale(img, (100, 100))
-
-        except Exception as e:
-            self.logger.info(f"Error loading sprite for {character_name}: {str(e)}")
-
-            surface = pygame.surface.Surface((100, 100))
-            color = character_colors.get(character_name, (255, 0, 0))
-            surface.fill(color)
-            return surface
+        return self.sprites.get(character_name, (100, 100))
 
     def draw_character(self, player_data, sprite):
         if not player_data:
             return
 
         # Draw the character sprite
+        sprite = self.sprites.facing(sprite, player_data.get('facing_right', False))
         self.screen.blit(sprite, (player_data['x'] - sprite.get_width() // 2,
                                   player_data['y'] - sprite.get_height()))
 
@@ -430,6 +579,60 @@ class GameClient:
             pygame.draw.rect(self.screen, self.GREEN, (bar_x, bar_y, health_width, bar_height))
         pygame.draw.rect(self.screen, self.BLACK, (bar_x, bar_y, bar_width, bar_height), 1)
 
+    def character_rect(self, player_data, sprite):
+        sprite_rect = pygame.Rect(player_data['x'] - sprite.get_width() // 2, player_data['y'] - sprite.get_height(),
+                                  sprite.get_width(), sprite.get_height())
+        bar_rect = pygame.Rect(player_data['x'] - 50, player_data['y'] - sprite.get_height() - 20, 100, 10)
+        # One pixel of margin covers the rounding of fractional positions
+        return sprite_rect.union(bar_rect).inflate(2, 2)
+
+    def character_drawable(self, key, player_data, sprite):
+        return (key, self.character_rect(player_data, sprite), (player_data.get('health'), id(sprite), player_data.get('facing_right', False)),
+                lambda: self.draw_character(player_data, sprite))
+
+    def draw_match(self, drawables):
+        if self.dirty_rendering:
+            # The platforms are part of the scene, erasing and drawing the characters is one renderer pass
+            self.get_scene()
+            self.profiler.mark('background')
+            dirty_rects = self.renderer.render(drawables)
+            self.profiler.mark('characters')
+            return dirty_rects
+
+        self.screen.fill(self.BLACK)
+        self.draw_background()
+        self.profiler.mark('background')
+        self.draw_platforms()
+        self.profiler.mark('platforms')
+        for key, rect, signature, draw in drawables:
+            draw()
+        self.profiler.mark('characters')
+        return None
+
+    def profiler_drawable(self):
+        # The text is rendered twice a second, in between the renderer sees an unchanged item
+        now = time.time()
+        if self.profiler_surface is None or now - self.profiler_refresh >= 0.5:
+            lines = self.profiler.summary_lines()
+            line_height = self.profiler_font.get_linesize()
+            width = max(self.profiler_font.size(line)[0] for line in lines) + 12
+            surface = pygame.Surface((width, line_height * len(lines) + 8), pygame.SRCALPHA)
+            surface.fill((0, 0, 0, 170))
+            for index, line in enumerate(lines):
+                surface.blit(self.profiler_font.render(line, True, self.WHITE), (6, 4 + index * line_height))
+            self.profiler_surface = surface
+            self.profiler_refresh = now
+
+        surface = self.profiler_surface
+        rect = surface.get_rect(topright=(self.SCREEN_WIDTH - 10, 10))
+        return 'profiler', rect, self.profiler_refresh, lambda: self.draw_profiler_overlay(surface, rect)
+
+    def draw_profiler_overlay(self, surface, rect):
+        # Drawn last by the renderer, its own cost goes to ui instead of characters
+        self.profiler.mark('characters')
+        self.screen.blit(surface, rect)
+        self.profiler.mark('ui')
+
     def draw_game_over_screen(self):
         overlay = pygame.Surface((self.SCREEN_WIDTH, self.SCREEN_HEIGHT))
         overlay.fill(self.BLACK)
@@ -468,41 +671,6 @@ class GameClient:
         exit_rect = exit_text.get_rect(center=(self.SCREEN_WIDTH / 2, self.SCREEN_HEIGHT / 2 + 60))
         self.screen.blit(exit_text, exit_rect)
 
-    def check_on_platform(self, player_x, player_y, feet_offset):
-        if len(self.platforms) == 0:
-            self.logger.info('Warning: No platform available')
-            return True, None
-
-        player_width = 50
-        player_feet_y = player_y + feet_offset
-        player_velocity_y = self.game_state['players'][self.player_num].get('velocity_y', 0) if self.player_num in self.game_state['players'] else 0
-
-        player_prev_feet_y = player_feet_y - player_velocity_y
-
-        steps = max(3, int(abs(player_velocity_y) / 5))
-
-        if player_prev_feet_y > player_feet_y:
-            start_y, end_y = player_feet_y, player_prev_feet_y
-        else:
-            start_y, end_y = player_prev_feet_y, player_feet_y
-        step_size = (end_y - start_y) / steps if steps > 0 else 0
-
-        for i in range(steps + 1):
-            check_y = start_y + step_size * i
-
-            for platform in self.platforms:
-                if (player_x + player_width > platform.x and
-                player_x - player_width < platform.x + platform.width):
-                    if platform.y - 20 <= check_y <= platform.y + 20:
-                        return True, platform.y
-        return False, None
-
-    def check_death(self, player_y):
-        if len(self.platforms) == 0:
-            return False
-        lowest_platform_y = max(platform.y for platform in self.platforms)
-        return player_y > lowest_platform_y + 100
-
     def run_game(self):
         current_time = pygame.time.get_ticks()
 
@@ -515,38 +683,40 @@ class GameClient:
             self.opponent_sprite.fill((255, 0, 0))
 
         opponent_num = 2 if self.player_num == 1 else 1
-        if opponent_num in self.game_state['players'] and self.game_state['players'][opponent_num].get('character'):
-            opponent_character = self.game_state['players'][opponent_num]['character']
-            self.logger.info(f'Opponent character: {opponent_character}')
+        players = self.game_state['players']
+        if opponent_num in players and players[opponent_num].get('character'):
+            opponent_character = players[opponent_num]['character']
             if not self.opponent_character or self.opponent_character != opponent_character:
+                self.logger.info(f'Opponent character: {opponent_character}')
                 self.opponent_character = opponent_character
                 self.opponent_sprite = self.create_character_sprite(opponent_character)
 
         running = True
         last_attack_time = 0
         last_special_attack_time = 0
-        special_attack_cooldown = 3000
-        is_jumping = False
-        jump_velocity = 0
-        gravity = 0.8
-        jump_strength = 18
-        player_width = 50
-        player_feet_offset = 10
+        # Cooldowns come from the same character table the server checks them with
+        stats = character_stats(self.character)
+        attack_cooldown = stats.basic_attack.cooldown * 1000
+        special_attack_cooldown = stats.special_attack.cooldown * 1000
         player_data = None
         last_action_time = time.time()
         action_throttle = 0.02
 
+        # Movement is predicted with the same fixed step simulation as the server.
+        # Every step is sent as a numbered input and kept until a snapshot says
+        # the server has applied it, then the rest is replayed on top of that state.
         predicted_player_state = None
-        last_input_sequence = 0
+        prediction_clock = FixedTimestep(self.simulation_rate)
+        reconciled_sequence = None
         input_sequence_number = 0
-        pending_inputs = []
+        pending_inputs = deque(maxlen=self.simulation_rate * 2)
 
-        last_opponent_state = None
         current_opponent_state = None
-        opponent_lerp_factor = 0.3
+        # The menus drew over the whole screen, so the first match frame is a full one
+        self.renderer.invalidate()
 
         while running and not self.reset_requested:
-            frame_start_time = time.time()
+            self.profiler.begin_frame()
 
             for event in pygame.event.get():
                 if event.type == QUIT:
@@ -562,157 +732,102 @@ class GameClient:
                         self.send_data(({'reset_game': True}))
                         self.game_over = False
                         self.winner = None
-
-            self.screen.fill(self.BLACK)
-            self.draw_background()
-            self.draw_platforms()
-
-            if self.player_num in self.game_state['players']:
-                server_player_state = self.game_state['players'][self.player_num]
+                    elif event.key == K_F9:
+                        if telemetry.sink is None:
+                            telemetry.enable_sink()
+                            self.logger.info('Recording telemetry, press F9 again to write it')
+                        else:
+                            records = telemetry.dump(self.telemetry_dump_path)
+                            self.logger.info(f'Wrote {records} telemetry records to {self.telemetry_dump_path}')
+                    elif event.key == K_F3:
+                        self.show_profiler = not self.show_profiler
+                    elif event.key == K_F4:
+                        frames = self.profiler.export_csv(self.frame_trace_path)
+                        self.logger.info(f'Wrote {frames} frames to {self.frame_trace_path}')
+            self.profiler.mark('events')
+
+            # One published state for the whole frame, a snapshot arriving meanwhile shows up next frame
+            players = self.game_state['players']
+            drawables = []
+            if self.player_num in players:
+                server_player_state = players[self.player_num]
                 if predicted_player_state is None:
-                    predicted_player_state = server_player_state.copy()
-                self.logger.info(f'player state: {predicted_player_state}')
-
-                if 'x' in server_player_state and 'x' in predicted_player_state:
-                    if abs(server_player_state['x'] - predicted_player_state['x']) > 15:
-                        predicted_player_state['x'] = server_player_state['x']
-                if 'y' in server_player_state and 'y' in predicted_player_state:
-                    if abs(server_player_state['y'] - predicted_player_state['y']) > 15:
-                        predicted_player_state['y'] = server_player_state['y']
-                        predicted_player_state['velocity_y'] = server_player_state.get('velocity_y', 0)
+                    predicted_player_state = PlayerState(self.player_num)
+                    predicted_player_state.update(server_player_state)
+                self.frame_telemetry.debug('player state: %s', predicted_player_state)
+
+                if self.last_snapshot_sequence != reconciled_sequence:
+                    reconciled_sequence = self.last_snapshot_sequence
+                    self.reconcile_prediction(predicted_player_state, server_player_state,
+                                              pending_inputs, prediction_clock.interval)
                 if 'health' in server_player_state:
                     predicted_player_state['health'] = server_player_state['health']
 
-                self.draw_character(predicted_player_state, self.character_sprite)
-
-
-            if opponent_num in self.game_state['players']:
-                opponent_state = self.game_state['players'][opponent_num]
+                drawables.append(self.character_drawable('player', predicted_player_state, self.character_sprite))
 
+            if opponent_num in players:
+                # Before the first snapshot only the match_start state is known
+                current_opponent_state = self.opponent_snapshots.sample(time.time())
                 if current_opponent_state is None:
-                    current_opponent_state = opponent_state.copy()
-
-                else:
-                    if 'x' in opponent_state and 'x' in current_opponent_state:
-                        current_opponent_state['x'] += (opponent_state['x'] - current_opponent_state['x']) * opponent_lerp_factor
-                    if 'y' in opponent_state and 'y' in current_opponent_state:
-                        current_opponent_state['y'] += (opponent_state['y'] - current_opponent_state['y']) * opponent_lerp_factor
+                    current_opponent_state = players[opponent_num]
 
-                    if 'health' in opponent_state:
-                        current_opponent_state['health'] = opponent_state['health']
-                    if 'is_attacking' in opponent_state:
-                        current_opponent_state['is_attacking'] = opponent_state['is_attacking']
-                    if 'is_special_attacking' in opponent_state:
-                        current_opponent_state['is_special_attacking'] = opponent_state['is_special_attacking']
-                    if 'facing_right' in opponent_state:
-                        current_opponent_state['facing_right'] = opponent_state['facing_right']
+                self.frame_telemetry.debug('opponent state: %s', current_opponent_state)
+                drawables.append(self.character_drawable('opponent', current_opponent_state, self.opponent_sprite))
 
-                self.logger.info(f'opponent state: {current_opponent_state}')
+            if self.show_profiler:
+                drawables.append(self.profiler_drawable())
+            self.profiler.mark('network')
 
-                self.draw_character(current_opponent_state, self.opponent_sprite)
+            dirty_rects = self.draw_match(drawables)
+            overlay_shown = False
 
+            if opponent_num in players:
                 if self.server_error:
                     self.draw_error_popup()
+                    overlay_shown = True
                 elif self.game_over:
                     self.draw_game_over_screen()
+                    overlay_shown = True
                 elif self.match_started and self.connected:
                     current_time = pygame.time.get_ticks()
                     keys = pygame.key.get_pressed()
 
-                    if self.player_num not in self.game_state['players']:
+                    if self.player_num not in players:
                         pygame.display.flip()
                         self.clock.tick(60)
                         continue
 
+                    if self.player_num == 1:
+                        left_key = K_q
+                        right_key = K_d
+                        jump_key = K_z
+                        attack_key = K_a
+                        special_attack_key = K_e
+                    else:
+                        left_key = K_LEFT
+                        right_key = K_RIGHT
+                        jump_key = K_UP
+                        attack_key = K_k
+                        special_attack_key = K_l
+
+                    # The server simulates movement from these inputs, positions are only predicted locally
+                    move = -1 if keys[left_key] else 1 if keys[right_key] else 0
+                    jump = bool(keys[jump_key])
+                    for _ in range(prediction_clock.due_steps(time.perf_counter())):
+                        input_sequence_number += 1
+                        inputs = {'move': move, 'jump': jump}
+                        step_player(predicted_player_state, inputs, self.platform_index, prediction_clock.interval)
+                        pending_inputs.append((input_sequence_number, inputs))
+                        self.send_input(input_sequence_number, move, jump)
+
                     if time.time() - last_action_time >= action_throttle:
                         action = {}
                         action_taken = False
 
-                        if self.player_num == 1:
-                            left_key = K_q
-                            right_key = K_d
-                            jump_key = K_z
-                            attack_key = K_a
-                            special_attack_key = K_e
-                        else:
-                            left_key = K_LEFT
-                            right_key = K_RIGHT
-                            jump_key = K_UP
-                            attack_key = K_k
-                            special_attack_key = K_l
-
-                        if keys[left_key]:
-                            if 'x' in predicted_player_state:
-                                predicted_player_state['x'] = max(50, predicted_player_state['x'] - 5)
-                                action['x'] = predicted_player_state['x']
-                                action['facing_right'] = False
-                                predicted_player_state['facing_right'] = False
-                                action_taken = True
-
-                        elif keys[right_key]:
-                            if 'x' in predicted_player_state:
-                                predicted_player_state['x'] = min(950, predicted_player_state['x'] + 5)
-                                action['x'] = predicted_player_state['x']
-                                action['facing_right'] = True
-                                predicted_player_state['facing_right'] = True
-                                action_taken = True
-
-                        on_platform, platform_y = self.check_on_platform(
-                            predicted_player_state.get('x', 0),
-                            predicted_player_state.get('y', 0),
-                            player_feet_offset
-                        )
-
-                        if keys[jump_key] and on_platform and not is_jumping:
-                            is_jumping = True
-                            predicted_player_state['velocity_y'] = -jump_strength
-                            jump_velocity = -jump_strength
-                            action['is_jumping'] = True
-                            action['velocity_y'] = predicted_player_state['velocity_y']
-                            action_taken = True
-
-                        if is_jumping or not on_platform:
-                            predicted_player_state['y'] += jump_velocity
-                            jump_velocity += gravity
-                            predicted_player_state['velocity_y'] = jump_velocity
-                            action['y'] = predicted_player_state['y']
-                            action['velocity_y'] = predicted_player_state['velocity_y']
-                            action_taken = True
-
-                        on_platform_now, landing_y = self.check_on_platform(
-                            predicted_player_state.get('x', 0),
-                            predicted_player_state.get('y', 0),
-                            player_feet_offset
-                        )
-
-                        if not on_platform:
-                            predicted_player_state['y'] += gravity
-                            predicted_player_state['velocity_y'] += gravity
-                            action['velocity_y'] = predicted_player_state['velocity_y']
-                            action_taken = True
-
-                        if on_platform_now and jump_velocity > 0:
-                            is_jumping = False
-                            jump_velocity = 0
-                            predicted_player_state['velocity_y'] = 0
-                            predicted_player_state['y'] = landing_y
-                            action['y'] = landing_y
-                            action['is_jumping'] = False
-                            action['velocity_y'] = 0
-                            action_taken = True
-
-                        if self.check_death(predicted_player_state.get('y', 0)):
-                            action['died'] = True
-                            predicted_player_state['is_dead'] = True
-                            self.send_data({'player_died': True})
-                            action_taken = True
-
-                        if keys[attack_key] and current_time - last_attack_time > 500:
+                        if keys[attack_key] and current_time - last_attack_time > attack_cooldown:
                             action['is_attacking'] = True
                             predicted_player_state['is_attacking'] = True
                             action['attack'] = True
-                            action['damage'] = 10
-                            action['attack_range'] = 150
                             last_attack_time = current_time
                             action_taken = True
 
@@ -721,32 +836,32 @@ class GameClient:
                             action['is_special_attacking'] = True
                             predicted_player_state['is_special_attacking'] = True
                             action['attack'] = True
-
-                            if self.character == 'Lucario':
-                                health_percent = predicted_player_state.get('health', 100) / 100
-                                action['damage'] = 25 * (1 + (1 - health_percent))
-                                action['attack_range'] = 200
-                            elif self.character == 'Mewtwo':
-                                action['damage'] = 30
-                                action['attack_range'] = 300
-                            elif self.character == 'Zeraora':
-                                action['damage'] = 20
-                                action['attack_range'] = 150
-                            elif self.character == 'Cinderace':
-                                opponent_data = current_opponent_state
-                                if opponent_data:
-                                    distance = abs(predicted_player_state.get('x', 0) - opponent_data.get('x', 0))
-                                    action['damage'] = 22 * (1 + distance / 250)
-                                    action['attack_range'] = 250
-
                             last_special_attack_time = current_time
                             action_taken = True
                         if action and action_taken and self.connected:
+                            # Damage is worked out by the server, against the opponent as drawn on this screen
+                            view_time = self.opponent_snapshots.render_time(time.time())
+                            if view_time is not None:
+                                action['view_time'] = view_time
                             self.send_data({'player_action': action})
                             last_action_time = time.time()
+            # Only one of the popups and the input handling runs in a frame
+            self.profiler.mark('ui' if overlay_shown else 'prediction')
 
-            pygame.display.flip()
+            if overlay_shown:
+                # Overlays cover the whole screen, the frame after them starts from a full redraw again
+                self.renderer.invalidate()
+                pygame.display.flip()
+            elif dirty_rects is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(dirty_rects)
+            self.profiler.mark('present')
             self.clock.tick(60)
+            self.profiler.mark('wait')
+
+            total_time, work_time = self.profiler.end_frame()
+            self.frame_telemetry.record('frame', work_time, self.rtt.smoothed or 0, self.opponent_snapshots.delay)
 
         if self.reset_requested:
             self.reset_requested = False
@@ -757,9 +872,6 @@ class GameClient:
             while self.connected and not self.server_error:
                 self.reset_requested = False
                 self.predicted_player_state = None
-                self.current_opponent_state = None
-                self.is_jumping = False
-                self.jump_velocity = 0
                 
                 self.select_character()
                 self.wait_for_match()
@@ -768,8 +880,10 @@ class GameClient:
                 if not self.connected or self.server_error:
                     break
 
-            if self.client_socket:
-                self.client_socket.close()
+            if self.connection:
+                self.connection.close()
+            if self.udp_socket:
+                self.udp_socket.close()
         else:
             self.logger.info('Failed to connect to server')
             self.server_error = True
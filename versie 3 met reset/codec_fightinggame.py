@@ -0,0 +1,192 @@
+import struct
+from collections import OrderedDict
+
+# Per-tick player state travels in a fixed binary layout instead of a pickled
+# dict. Numeric fields are packed as float32, booleans share one flag byte and
+# last_input echoes the newest input sequence the server has simulated.
+PLAYER_FIELDS = ('x', 'y', 'health', 'velocity_y')
+PLAYER_FLAGS = ('is_dead', 'is_attacking', 'is_special_attacking', 'facing_right', 'is_jumping')
+
+# A snapshot only carries the players and fields that changed since the
+# baseline snapshot the client acknowledged. Baseline 0 means "no baseline",
+# so every field of every player is included.
+SNAPSHOT_HEADER = struct.Struct('!IIdB')
+SEQUENCE = struct.Struct('!I')
+ACK = SEQUENCE
+INPUT = struct.Struct('!IbB')
+
+FLAG_BITS = tuple((name, 1 << bit) for bit, name in enumerate(PLAYER_FLAGS))
+FLAGS_INDEX = len(PLAYER_FIELDS)
+INPUT_INDEX = FLAGS_INDEX + 1
+EMPTY_RECORD = (0.0,) * len(PLAYER_FIELDS) + (0, 0)
+FULL_MASK = (1 << (INPUT_INDEX + 1)) - 1
+HISTORY_SIZE = 64
+
+# A player entry is its header followed by the parts of the record its mask
+# selects. Every mask gets one precompiled Struct, so a player is packed and
+# unpacked with a single call whether it is a full record or a delta.
+RECORD_CODES = ('f',) * len(PLAYER_FIELDS) + ('B', 'I')
+RECORD_LAYOUTS = {}
+
+
+def record_layout(mask):
+    """The Struct for a player entry with mask, and the record indices it carries."""
+    layout = RECORD_LAYOUTS.get(mask)
+    if layout is None:
+        if mask & ~FULL_MASK:
+            raise ValueError(f'Unknown field mask {mask:#x}')
+        indices = tuple(index for index in range(len(RECORD_CODES)) if mask & (1 << index))
+        layout = RECORD_LAYOUTS[mask] = (struct.Struct('!BB' + ''.join(RECORD_CODES[index] for index in indices)),
+                                         indices)
+    return layout
+
+
+def pack_flags(player):
+    # One bit per name in PLAYER_FLAGS, in that order
+    return (bool(player.is_dead) | bool(player.is_attacking) << 1 | bool(player.is_special_attacking) << 2 |
+            bool(player.facing_right) << 3 | bool(player.is_jumping) << 4)
+
+
+# Every possible flag byte already spread out over the flag names
+FLAG_VALUES = tuple({name: flags & bit != 0 for name, bit in FLAG_BITS} for flags in range(256))
+
+
+def record_state(record):
+    state = dict(zip(PLAYER_FIELDS, record))
+    state.update(FLAG_VALUES[record[FLAGS_INDEX]])
+    state['last_input'] = record[INPUT_INDEX]
+    return state
+
+
+def player_record(player):
+    return (player.x, player.y, player.health, player.velocity_y, pack_flags(player), player.last_input)
+
+
+def encode_ack(sequence):
+    return ACK.pack(sequence)
+
+
+def decode_ack(payload):
+    return {'ack': ACK.unpack_from(payload, 0)[0]}
+
+
+def encode_input(sequence, move, jump):
+    return INPUT.pack(sequence, move, jump)
+
+
+def decode_input(payload):
+    sequence, move, jump = INPUT.unpack_from(payload, 0)
+    return {'player_action': {'sequence': sequence, 'move': move, 'jump': bool(jump)}}
+
+
+class SnapshotEncoder:
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history_size = history_size
+        self.history = OrderedDict()
+        self.capture_times = {}
+        self.sequence = 0
+        self.timestamp = 0.0
+        self.payloads = {}
+
+    def capture(self, players, timestamp):
+        self.sequence += 1
+        self.timestamp = timestamp
+        self.history[self.sequence] = {player_num: player_record(player)
+                                       for player_num, player in players.items()}
+        self.capture_times[self.sequence] = timestamp
+        while len(self.history) > self.history_size:
+            self.capture_times.pop(self.history.popitem(last=False)[0], None)
+        self.payloads = {}
+        return self.sequence
+
+    def reset(self):
+        # Sequence numbers keep counting so late acks can never match a new snapshot
+        self.history.clear()
+        self.capture_times.clear()
+        self.payloads = {}
+
+    def capture_time(self, sequence):
+        """When a snapshot still in the history was captured, an ack for it measures the round trip."""
+        return self.capture_times.get(sequence)
+
+    def encode(self, baseline_sequence=None):
+        baseline = self.history.get(baseline_sequence) if baseline_sequence else None
+        if baseline is None:
+            baseline_sequence, baseline = 0, {}
+
+        payload = self.payloads.get(baseline_sequence)
+        if payload is not None:
+            return payload
+
+        parts = [b'']
+        for player_num, record in self.history[self.sequence].items():
+            previous = baseline.get(player_num)
+            if previous is None:
+                mask, values = FULL_MASK, record
+            elif record == previous:
+                continue
+            else:
+                mask = 0
+                values = []
+                for index, value in enumerate(record):
+                    if value != previous[index]:
+                        mask |= 1 << index
+                        values.append(value)
+            parts.append(record_layout(mask)[0].pack(player_num, mask, *values))
+        changed_players = len(parts) - 1
+
+        parts[0] = SNAPSHOT_HEADER.pack(self.sequence, baseline_sequence, self.timestamp, changed_players)
+        payload = b''.join(parts)
+        self.payloads[baseline_sequence] = payload
+        return payload
+
+
+class SnapshotDecoder:
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.history_size = history_size
+        self.history = OrderedDict()
+        self.latest_sequence = 0
+
+    def reset(self):
+        self.history.clear()
+        self.latest_sequence = 0
+
+    def is_stale(self, payload):
+        return SNAPSHOT_HEADER.unpack_from(payload, 0)[0] <= self.latest_sequence
+
+    def decode(self, payload):
+        sequence, baseline_sequence, timestamp, count = SNAPSHOT_HEADER.unpack_from(payload, 0)
+        if baseline_sequence:
+            baseline = self.history.get(baseline_sequence)
+            if baseline is None:
+                raise ValueError(f'Snapshot {sequence} refers to unknown baseline {baseline_sequence}')
+            records = dict(baseline)
+        else:
+            records = {}
+
+        offset = SNAPSHOT_HEADER.size
+        for _ in range(count):
+            mask = payload[offset + 1]
+            layout, indices = record_layout(mask)
+            player_num, mask, *values = layout.unpack_from(payload, offset)
+            offset += layout.size
+
+            if mask == FULL_MASK:
+                record = tuple(values)
+            else:
+                record = list(records.get(player_num, EMPTY_RECORD))
+                for index, value in zip(indices, values):
+                    record[index] = value
+                record = tuple(record)
+            records[player_num] = record
+
+        self.history[sequence] = records
+        self.latest_sequence = max(self.latest_sequence, sequence)
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+
+        # Every player in full: the delta is against the acked baseline, not
+        # against the last snapshot the client applied, so a field that changed
+        # and changed back while the ack was in flight is not in the delta
+        players = {player_num: record_state(record) for player_num, record in records.items()}
+        return {'players': players, 'timestamp': timestamp, 'sequence': sequence}
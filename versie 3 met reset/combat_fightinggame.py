@@ -0,0 +1,87 @@
+from bisect import bisect_right
+
+from simulation_fightinggame import PLAYER_HALF_WIDTH, SCREEN_MIN_X, SCREEN_MAX_X
+
+# Attack numbers come from the character table, an attack message only says
+# which attack was used. Cooldowns get a little slack because network
+# jitter can bunch two presses together.
+ATTACK_HEIGHT = 100
+COOLDOWN_TOLERANCE = 0.1
+
+
+def in_reach(attacker, x, y, attack_range):
+    ahead = x - attacker.x if attacker.facing_right else attacker.x - x
+    # Overlapping players can hit each other whichever way they face
+    return -PLAYER_HALF_WIDTH <= ahead <= attack_range and abs(y - attacker.y) <= ATTACK_HEIGHT
+
+
+def knock_back(attacker, defender, distance):
+    if distance:
+        direction = 1 if defender.x >= attacker.x else -1
+        defender.x = max(SCREEN_MIN_X, min(SCREEN_MAX_X, defender.x + direction * distance))
+
+
+class PositionHistory:
+    # Where every player was after each tick, so a hit can be checked
+    # against the positions the attacker was looking at. The capacity bounds
+    # the memory per room and how far back a client can rewind. The entries
+    # live in preallocated lists used as a ring, head is the oldest once the
+    # ring is full. Timestamps only grow, so both halves of the ring are
+    # sorted and finding a moment is a bisect on one of them.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = [0.0] * capacity
+        self.positions = [None] * capacity
+        self.head = 0
+        self.count = 0
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def record(self, timestamp, players):
+        if self.count and timestamp <= self.newest_time():
+            return
+        if self.count < self.capacity:
+            index = self.count
+            self.count += 1
+        else:
+            index = self.head
+            self.head = (self.head + 1) % self.capacity
+        self.timestamps[index] = timestamp
+        self.positions[index] = {player_num: (player.x, player.y) for player_num, player in players.items()}
+
+    def newest_time(self):
+        return self.timestamps[(self.head + self.count - 1) % self.capacity] if self.count else None
+
+    def bisect(self, timestamp):
+        """The number of entries recorded at or before timestamp."""
+        if self.head == 0:
+            return bisect_right(self.timestamps, timestamp, 0, self.count)
+        # Full and wrapped: head..capacity holds the older half, 0..head the newer one
+        if timestamp >= self.timestamps[0]:
+            return self.capacity - self.head + bisect_right(self.timestamps, timestamp, 0, self.head)
+        return bisect_right(self.timestamps, timestamp, self.head, self.capacity) - self.head
+
+    def entry(self, age):
+        """(timestamp, positions) of the entry age places after the oldest."""
+        index = (self.head + age) % self.capacity
+        return self.timestamps[index], self.positions[index]
+
+    def position_at(self, player_num, timestamp):
+        """Returns (x, y) of the player at timestamp, clamped to the recorded window, or None."""
+        if not self.count:
+            return None
+        index = self.bisect(timestamp)
+        if index == 0:
+            return self.entry(0)[1].get(player_num)
+        if index == self.count:
+            return self.entry(self.count - 1)[1].get(player_num)
+
+        start_time, start = self.entry(index - 1)
+        end_time, end = self.entry(index)
+        start, end = start.get(player_num), end.get(player_num)
+        if start is None or end is None:
+            return end or start
+        fraction = (timestamp - start_time) / (end_time - start_time)
+        return (start[0] + (end[0] - start[0]) * fraction, start[1] + (end[1] - start[1]) * fraction)
@@ -0,0 +1,42 @@
+import threading
+
+
+def empty_state():
+    return {'players': {}, 'platforms': []}
+
+
+class GameStateBuffer:
+    # The network threads build every new game state in a back buffer next
+    # to the published one and publish it by swapping a single reference.
+    # A published state is never changed again, so the render thread reads
+    # front once per frame and needs no lock or copy. Players a snapshot did
+    # not touch are shared between states instead of copied. The old front
+    # is not recycled as the next back buffer, the renderer may still hold it.
+    def __init__(self):
+        self.front = empty_state()
+        # Only writers take it, TCP and UDP messages arrive on different threads
+        self.write_lock = threading.Lock()
+
+    def publish(self, state):
+        """Replaces the whole state, for the full states in match_start, game_over and game_reset."""
+        back = empty_state()
+        back.update(state)
+        back['players'] = {player_num: dict(player) for player_num, player in back['players'].items()}
+        with self.write_lock:
+            self.front = back
+        return back
+
+    def merge(self, players=None, platforms=None):
+        """Applies the changed fields of a snapshot and publishes the result, returns the new state."""
+        with self.write_lock:
+            back = dict(self.front)
+            if players:
+                back['players'] = dict(back['players'])
+                for player_num, changes in players.items():
+                    player = dict(back['players'].get(player_num, ()))
+                    player.update(changes)
+                    back['players'][player_num] = player
+            if platforms is not None:
+                back['platforms'] = platforms
+            self.front = back
+        return back
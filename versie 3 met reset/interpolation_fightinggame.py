@@ -0,0 +1,82 @@
+import threading
+from collections import deque
+
+INTERPOLATED_FIELDS = ('x', 'y')
+MAX_INTERPOLATION_DELAY = 0.25
+
+
+class SnapshotBuffer:
+    # Remote players are drawn `delay` seconds in the past, between the two
+    # snapshots around that moment, so the result no longer depends on the
+    # frame rate or on when packets happen to arrive.
+    def __init__(self, delay=0.1, capacity=32, max_extrapolation=0.25):
+        self.delay = delay
+        self.max_extrapolation = max_extrapolation
+        self.snapshots = deque(maxlen=capacity)
+        self.clock_offset = None
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.snapshots.clear()
+            self.clock_offset = None
+
+    def push(self, timestamp, state, received_time):
+        with self.lock:
+            if self.snapshots and timestamp <= self.snapshots[-1][0]:
+                return
+
+            # The packet with the least delay gives the best guess of the server clock
+            offset = timestamp - received_time
+            if self.clock_offset is None or offset > self.clock_offset:
+                self.clock_offset = offset
+            self.snapshots.append((timestamp, dict(state)))
+
+    def render_time(self, now):
+        """The server time that sample(now) shows, None before the first snapshot."""
+        if self.clock_offset is None:
+            return None
+        return now + self.clock_offset - self.delay
+
+    def sample(self, now):
+        with self.lock:
+            if not self.snapshots:
+                return None
+
+            render_time = self.render_time(now)
+            oldest_time, oldest = self.snapshots[0]
+            if render_time <= oldest_time:
+                return dict(oldest)
+
+            newest_time, newest = self.snapshots[-1]
+            if render_time >= newest_time:
+                return self.extrapolate(render_time)
+
+            for index in range(len(self.snapshots) - 1, 0, -1):
+                start_time, start = self.snapshots[index - 1]
+                if start_time <= render_time:
+                    end_time, end = self.snapshots[index]
+                    return blend(start, end, (render_time - start_time) / (end_time - start_time))
+
+    def extrapolate(self, render_time):
+        newest_time, newest = self.snapshots[-1]
+        state = dict(newest)
+        if len(self.snapshots) < 2:
+            return state
+
+        # Packet loss: keep moving along the last known velocity for a short while, then hold
+        previous_time, previous = self.snapshots[-2]
+        elapsed = min(render_time - newest_time, self.max_extrapolation)
+        for field in INTERPOLATED_FIELDS:
+            if field in newest and field in previous:
+                velocity = (newest[field] - previous[field]) / (newest_time - previous_time)
+                state[field] = newest[field] + velocity * elapsed
+        return state
+
+
+def blend(start, end, fraction):
+    state = dict(end)
+    for field in INTERPOLATED_FIELDS:
+        if field in start and field in end:
+            state[field] = start[field] + (end[field] - start[field]) * fraction
+    return state
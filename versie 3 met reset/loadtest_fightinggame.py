@@ -0,0 +1,251 @@
+import argparse
+import logging
+import socket
+import threading
+import time
+
+from network_fightinggame import FramedConnection, DatagramChannel, decode_datagram, MAX_DATAGRAM_SIZE, KIND_SNAPSHOT
+from character_stats_fightinggame import CHARACTERS
+from metrics_fightinggame import LatencyHistogram
+from server_fightinggame import GameServer
+from async_server_fightinggame import AsyncGameServer
+
+
+class BotClient:
+    # Speaks the same protocol as GameClient without pygame: it picks a
+    # character, readies up and streams numbered movement inputs plus an
+    # attack now and then. Player 1 asks for a reset after every game over so
+    # the room keeps playing.
+    def __init__(self, host, port, character='Lucario', use_udp=True, attack_interval=0.5, input_rate=60):
+        self.host = host
+        self.port = port
+        self.character = character
+        self.use_udp = use_udp
+        self.attack_interval = attack_interval
+        self.input_interval = 1 / input_rate
+
+        self.connection = None
+        self.player_num = None
+        self.connected = False
+        self.match_started = False
+        self.game_over = False
+        self.datagram_channel = None
+        self.udp_socket = None
+        self.udp_ready = False
+
+        self.snapshots_received = 0
+        self.snapshots_missed = 0
+        self.last_sequence = None
+        self.datagram_bytes_sent = 0
+        self.datagram_bytes_received = 0
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        sock.settimeout(None)
+        self.connection = FramedConnection(sock)
+        response = self.connection.next_message()
+        if response is None or response.get('status') != 'connected':
+            self.connection.close()
+            return False
+
+        self.player_num = response['player_num']
+        self.connected = True
+        for target in (self.receive_data, self.play):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        self.select_character()
+        return True
+
+    def select_character(self):
+        self.connection.send({'character_select': self.character})
+        self.connection.send({'ready': True})
+
+    def realtime_channel(self):
+        if self.udp_ready:
+            return self.datagram_channel
+        return self.connection
+
+    def open_datagram_channel(self, port, token):
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.bind(('', 0))
+        self.datagram_channel = DatagramChannel(self.send_datagram, (self.host, port), token)
+        thread = threading.Thread(target=self.receive_datagrams)
+        thread.daemon = True
+        thread.start()
+        self.datagram_channel.send_ack(0)
+
+    def send_datagram(self, data, address):
+        self.datagram_bytes_sent += len(data)
+        self.udp_socket.sendto(data, address)
+
+    def receive_datagrams(self):
+        while self.connected:
+            try:
+                data, address = self.udp_socket.recvfrom(MAX_DATAGRAM_SIZE)
+            except OSError:
+                break
+            self.datagram_bytes_received += len(data)
+            try:
+                token, kind, payload = decode_datagram(data)
+            except Exception:
+                continue
+            if token == self.datagram_channel.token and kind == KIND_SNAPSHOT:
+                message = self.connection.decode_datagram(kind, payload)
+                if message is not None:
+                    self.handle_server_message(message)
+
+    def receive_data(self):
+        try:
+            while self.connected:
+                messages = self.connection.receive()
+                if messages is None:
+                    break
+                for response in messages:
+                    self.handle_server_message(response)
+        except OSError:
+            pass
+        finally:
+            self.connected = False
+
+    def handle_server_message(self, response):
+        status = response.get('status')
+        if status == 'match_start':
+            self.match_started = True
+            self.game_over = False
+        elif status == 'game_over':
+            if not self.game_over and self.player_num == 1:
+                self.connection.send({'reset_game': True})
+            self.game_over = True
+        elif status == 'game_reset':
+            self.match_started = False
+            self.game_over = False
+            self.select_character()
+        elif status == 'udp_offer':
+            if self.use_udp:
+                self.open_datagram_channel(response['port'], response['token'])
+        elif status == 'udp_ready':
+            self.udp_ready = True
+        elif status == 'heartbeat':
+            self.connection.send({'pong': response['ping']})
+        elif 'sequence' in response:
+            sequence = response['sequence']
+            if self.last_sequence is not None and sequence > self.last_sequence + 1:
+                self.snapshots_missed += sequence - self.last_sequence - 1
+            self.last_sequence = sequence
+            self.snapshots_received += 1
+            self.realtime_channel().send_ack(sequence)
+
+    def play(self):
+        sequence = 0
+        next_input = time.perf_counter()
+        last_attack = 0
+        # Player 1 starts on the left and player 2 on the right, both walk towards the middle first
+        direction = 1 if self.player_num == 1 else -1
+
+        while self.connected:
+            now = time.perf_counter()
+            if self.match_started and not self.game_over:
+                sequence += 1
+                move = direction if int(now) % 2 == 0 else -direction
+                jump = sequence % 90 == 0
+                self.realtime_channel().send_input(sequence, move, jump)
+
+                if self.attack_interval and now - last_attack >= self.attack_interval:
+                    self.connection.send({'player_action': {'attack': True, 'is_attacking': True}})
+                    last_attack = now
+
+            next_input += self.input_interval
+            time.sleep(max(0.0, next_input - time.perf_counter()))
+
+    def bytes_sent(self):
+        return self.connection.bytes_sent + self.datagram_bytes_sent
+
+    def bytes_received(self):
+        return self.connection.bytes_received + self.datagram_bytes_received
+
+    def close(self):
+        self.connected = False
+        self.connection.close()
+        if self.udp_socket:
+            self.udp_socket.close()
+
+
+def summarize(histogram):
+    if not histogram.count:
+        return '   -   /   -  '
+    return f'{histogram.mean() * 1000:6.3f} / {histogram.percentile(0.99) * 1000:6.3f}'
+
+
+def run_load_test(bots=20, duration=30.0, host=None, port=5600, use_udp=True, use_async=False,
+                  report_interval=5.0, connect_rate=50, vector_physics=False, record_dir=None):
+    server = None
+    if host is None:
+        server_class = AsyncGameServer if use_async else GameServer
+        server = server_class(port=port, max_rooms=bots // 2 + 1, udp=use_udp, vector_physics=vector_physics,
+                              record_dir=record_dir)
+        server.logger.setLevel(logging.WARNING)
+        thread = threading.Thread(target=server.start)
+        thread.daemon = True
+        thread.start()
+        time.sleep(0.5)
+        host = '127.0.0.1'
+
+    clients = []
+    characters = list(CHARACTERS)
+    for index in range(bots):
+        bot = BotClient(host, port, characters[index % len(characters)], use_udp=use_udp)
+        if bot.connect():
+            clients.append(bot)
+        time.sleep(1 / connect_rate)
+    print(f'{len(clients)} of {bots} bots connected to {host}:{port}')
+
+    print(f'{"time":>6} {"bots":>5} {"snap/s":>8} {"in kB/s":>9} {"out kB/s":>9} '
+          f'{"tick ms avg/p99":>16} {"fan-out ms avg/p99":>19} {"missed":>7} {"dropped":>8}')
+    start = time.time()
+    last_report = start
+    last_totals = (0, 0, 0)
+    # The tick and fan-out columns come from the server's own histograms, only the part since the last report
+    last_histograms = (LatencyHistogram(), LatencyHistogram())
+    while time.time() - start < duration:
+        time.sleep(report_interval)
+        now = time.time()
+        elapsed = now - last_report
+        totals = (sum(bot.snapshots_received for bot in clients),
+                  sum(bot.bytes_received() for bot in clients),
+                  sum(bot.bytes_sent() for bot in clients))
+        snapshots, received, sent = (total - last for total, last in zip(totals, last_totals))
+        histograms = (server.metrics.histogram('tick'), server.metrics.histogram('broadcast')) if server else last_histograms
+        tick_times, broadcast_times = (histogram.since(last) for histogram, last in zip(histograms, last_histograms))
+        missed = sum(bot.snapshots_missed for bot in clients)
+        dropped = server.clock.dropped_ticks if server else '-'
+        alive = sum(1 for bot in clients if bot.connected)
+
+        print(f'{now - start:6.1f} {alive:5d} {snapshots / elapsed:8.0f} {received / elapsed / 1024:9.1f} '
+              f'{sent / elapsed / 1024:9.1f} {summarize(tick_times):>16} {summarize(broadcast_times):>19} '
+              f'{missed:7d} {dropped:>8}')
+        last_report = now
+        last_totals = totals
+        last_histograms = histograms
+
+    for bot in clients:
+        bot.close()
+    if server:
+        server.close_server()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run headless bot clients against a GameServer')
+    parser.add_argument('--bots', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--host', help='connect to a running server instead of starting one')
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--tcp-only', action='store_true')
+    parser.add_argument('--async-server', action='store_true')
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    parser.add_argument('--vector-physics', action='store_true', help='step all rooms in one NumPy batch')
+    parser.add_argument('--record', metavar='DIR', help='write a replay of every room to DIR')
+    args = parser.parse_args()
+
+    run_load_test(args.bots, args.duration, args.host, args.port, not args.tcp_only, args.async_server,
+                  args.report_interval, vector_physics=args.vector_physics, record_dir=args.record)
@@ -0,0 +1,147 @@
+import json
+import math
+import threading
+import time
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latencies go into buckets that are a quarter octave wide, from 2^-20 s
+# (about a microsecond) up to 2^2 s. An observation is one frexp and one
+# increment, the percentiles are read from the bucket bounds.
+SUB_BUCKETS = 4
+MIN_EXPONENT = -20
+MAX_EXPONENT = 2
+BUCKET_COUNT = (MAX_EXPONENT - MIN_EXPONENT) * SUB_BUCKETS
+
+logger = logging.getLogger('GameMetrics')
+
+
+def bucket_index(seconds):
+    if seconds <= 0:
+        return 0
+    mantissa, exponent = math.frexp(seconds)
+    index = (exponent - MIN_EXPONENT - 1) * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+    return max(0, min(BUCKET_COUNT - 1, index))
+
+
+def bucket_bound(index):
+    """The upper bound in seconds of a bucket."""
+    exponent, sub_bucket = divmod(index, SUB_BUCKETS)
+    return math.ldexp(0.5 + (sub_bucket + 1) / (2 * SUB_BUCKETS), exponent + MIN_EXPONENT + 1)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bucket_index(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def copy(self):
+        histogram = LatencyHistogram()
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.total = self.total
+        histogram.max = self.max
+        return histogram
+
+    def since(self, earlier):
+        """The observations made after the copy earlier was taken. max stays the overall maximum."""
+        histogram = self.copy()
+        histogram.counts = [count - before for count, before in zip(self.counts, earlier.counts)]
+        histogram.count -= earlier.count
+        histogram.total -= earlier.total
+        return histogram
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        wanted = max(1, math.ceil(self.count * fraction))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(bucket_bound(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.mean() * 1000, 4),
+            'p50_ms': round(self.percentile(0.5) * 1000, 4),
+            'p99_ms': round(self.percentile(0.99) * 1000, 4),
+            'max_ms': round(self.max * 1000, 4)
+        }
+
+
+class ServerMetrics:
+    # Latency histograms per server phase and the counters that are not kept
+    # on a connection. Client threads, the tick loop and the stats endpoint
+    # all use it, one lock covers every histogram and counter.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, phase, seconds):
+        with self.lock:
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def histogram(self, phase):
+        """A copy of one phase histogram, empty when the phase never ran."""
+        with self.lock:
+            histogram = self.histograms.get(phase)
+            return histogram.copy() if histogram else LatencyHistogram()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'uptime': round(time.time() - self.started, 1),
+                'phases': {phase: histogram.summary() for phase, histogram in self.histograms.items()},
+                'counters': dict(self.counters)
+            }
+
+
+class StatsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ('/', '/stats'):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.collect_stats(), indent=2).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start_stats_endpoint(collect_stats, host='127.0.0.1', port=5556):
+    """Serves collect_stats() as JSON over HTTP on a daemon thread, returns the HTTP server."""
+    server = ThreadingHTTPServer((host, port), StatsRequestHandler)
+    server.daemon_threads = True
+    server.collect_stats = collect_stats
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,409 @@
+import pickle
+import socket
+import struct
+import threading
+import time
+import logging
+
+from codec_fightinggame import SnapshotDecoder, encode_ack, decode_ack, encode_input, decode_input
+from telemetry_fightinggame import telemetry
+
+# Every message on the wire is one frame: a 4 byte payload length, a 1 byte
+# payload kind and then the payload itself.
+HEADER = struct.Struct('!IB')
+KIND_PICKLE = 0
+KIND_SNAPSHOT = 1
+KIND_ACK = 2
+KIND_INPUT = 3
+
+MAX_FRAME_SIZE = 1024 * 1024
+DEFAULT_BUFFER_SIZE = 64 * 1024
+MAX_PENDING_BYTES = 256 * 1024
+
+# Real-time traffic can also go over UDP. A datagram is the session token
+# handed out over TCP followed by one ordinary frame. Only kinds that are
+# safe to lose or reorder are accepted there, never pickles.
+DATAGRAM_HEADER = struct.Struct('!I')
+DATAGRAM_KINDS = (KIND_SNAPSHOT, KIND_ACK, KIND_INPUT)
+MAX_DATAGRAM_SIZE = 1400
+
+logger = logging.getLogger('GameNetwork')
+decode_telemetry = telemetry.channel('network.decode', logger, max_per_second=1)
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(payload, kind=KIND_PICKLE):
+    return HEADER.pack(len(payload), kind) + payload
+
+
+def encode_message(message):
+    return encode_frame(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def encode_snapshot_frame(payload):
+    return encode_frame(payload, KIND_SNAPSHOT)
+
+
+def encode_datagram(token, frame):
+    return DATAGRAM_HEADER.pack(token) + frame
+
+
+def decode_datagram(data):
+    payload_start = DATAGRAM_HEADER.size + HEADER.size
+    if len(data) < payload_start:
+        raise ProtocolError(f'Datagram of {len(data)} bytes is too short')
+    token = DATAGRAM_HEADER.unpack_from(data, 0)[0]
+    length, kind = HEADER.unpack_from(data, DATAGRAM_HEADER.size)
+    if length != len(data) - payload_start:
+        raise ProtocolError(f'Datagram frame claims {length} bytes but carries {len(data) - payload_start}')
+    if kind not in DATAGRAM_KINDS:
+        raise ProtocolError(f'Frame kind {kind} is not allowed in a datagram')
+    return token, kind, memoryview(data)[payload_start:]
+
+
+class RttEstimator:
+    # Smoothed round trip time and jitter the way TCP keeps them (RFC 6298):
+    # every sample moves the average by 1/8 and the mean deviation by 1/4.
+    def __init__(self):
+        self.smoothed = None
+        self.jitter = 0.0
+        self.samples = 0
+
+    def add(self, sample):
+        if self.smoothed is None:
+            self.smoothed = sample
+            self.jitter = sample / 2
+        else:
+            self.jitter += (abs(self.smoothed - sample) - self.jitter) / 4
+            self.smoothed += (sample - self.smoothed) / 8
+        self.samples += 1
+
+
+class FrameSender:
+    # Heartbeats are only sent over a link nothing else was sent on for a while
+    last_send_time = 0.0
+
+    def send(self, message):
+        self.send_frame(encode_message(message))
+
+    def send_ack(self, sequence):
+        self.send_frame(encode_frame(encode_ack(sequence), KIND_ACK))
+
+    def send_input(self, sequence, move, jump):
+        self.send_frame(encode_frame(encode_input(sequence, move, jump), KIND_INPUT))
+
+    def send_snapshot(self, payload):
+        self.send_frame(encode_snapshot_frame(payload))
+
+    def send_frame(self, frame):
+        raise NotImplementedError
+
+
+class DatagramChannel(FrameSender):
+    def __init__(self, sendto, address, token):
+        self.sendto = sendto
+        self.address = address
+        self.token = token
+        self.bytes_sent = 0
+        self.frames_sent = 0
+        # Counted by whoever receives the datagrams, they all arrive on one shared socket
+        self.bytes_received = 0
+
+    def send_frame(self, frame):
+        data = encode_datagram(self.token, frame)
+        self.sendto(data, self.address)
+        self.bytes_sent += len(data)
+        self.frames_sent += 1
+        self.last_send_time = time.time()
+
+
+class FramedConnection(FrameSender):
+    def __init__(self, sock, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+
+        # One receive buffer per connection, reused for every recv_into call.
+        # start/end mark the bytes that have been received but not decoded yet.
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(buffer_size)
+        self.start = 0
+        self.end = 0
+        self.decode_errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.superseded_snapshots = 0
+        self.snapshots = SnapshotDecoder()
+
+        # Set once the peer has been reached over UDP, real-time frames then go there
+        self.datagram = None
+        self.datagram_token = None
+
+    def send_frame(self, frame):
+        with self.send_lock:
+            self.sock.sendall(frame)
+            self.bytes_sent += len(frame)
+            self.frames_sent += 1
+            self.last_send_time = time.time()
+
+    def idle_time(self, now):
+        """Seconds since anything was sent to the peer, over TCP or UDP."""
+        last_send_time = self.last_send_time
+        if self.datagram is not None:
+            last_send_time = max(last_send_time, self.datagram.last_send_time)
+        return now - last_send_time
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _reserve(self, needed):
+        if len(self.buffer) - self.end >= needed:
+            return
+        pending = self.end - self.start
+        if self.start:
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        if len(self.buffer) - self.end < needed:
+            self.buffer.extend(bytes(needed - (len(self.buffer) - self.end)))
+
+    def feed(self, data):
+        self._reserve(len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def _fill(self):
+        self._reserve(HEADER.size)
+        received = self.sock.recv_into(memoryview(self.buffer)[self.end:])
+        if not received:
+            return False
+        self.end += received
+        self.bytes_received += received
+        return True
+
+    def _next_frame(self):
+        if self.end - self.start < HEADER.size:
+            return None
+        length, kind = HEADER.unpack_from(self.buffer, self.start)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f'Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit')
+
+        frame_end = self.start + HEADER.size + length
+        if frame_end > self.end:
+            # Only the bytes of this frame that have not arrived yet, the part already received is kept
+            self._reserve(frame_end - self.end)
+            return None
+
+        payload_start = self.start + HEADER.size
+        self.start = frame_end
+        if self.start == self.end:
+            self.start = self.end = 0
+        return kind, payload_start, frame_end
+
+    def _decode_payload(self, kind, payload):
+        if kind == KIND_SNAPSHOT:
+            return self.snapshots.decode(payload)
+        if kind == KIND_ACK:
+            return decode_ack(payload)
+        if kind == KIND_INPUT:
+            return decode_input(payload)
+        if kind == KIND_PICKLE:
+            return pickle.loads(payload)
+        raise ProtocolError(f'Unknown frame kind {kind}')
+
+    def _decode_next(self):
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return None
+            kind, payload_start, payload_end = frame
+            message = None
+            with memoryview(self.buffer) as view:
+                try:
+                    message = self._decode_payload(kind, view[payload_start:payload_end])
+                    self.frames_received += 1
+                except (pickle.UnpicklingError, struct.error, ProtocolError, EOFError, ValueError) as e:
+                    self.decode_errors += 1
+                    decode_telemetry.info('Dropped undecodable frame: %s', e)
+            self._shrink()
+            if message is not None:
+                return message
+
+    def _shrink(self):
+        # A large frame grows the buffer, once it is decoded and nothing is pending it goes back to its normal size
+        if self.start == self.end and len(self.buffer) > self.buffer_size:
+            self.buffer = bytearray(self.buffer_size)
+            self.start = self.end = 0
+
+    def decode_datagram(self, kind, payload):
+        # Datagrams can arrive late or twice, an older snapshot than the newest one is useless
+        try:
+            if kind == KIND_SNAPSHOT and self.snapshots.is_stale(payload):
+                return None
+            message = self._decode_payload(kind, payload)
+            self.frames_received += 1
+            return message
+        except (struct.error, ProtocolError, ValueError) as e:
+            self.decode_errors += 1
+            decode_telemetry.info('Dropped undecodable datagram: %s', e)
+            return None
+
+    def drain(self):
+        messages = []
+        while True:
+            message = self._decode_next()
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def receive(self):
+        """Returns every complete message after at most one recv, or None when the peer closed."""
+        messages = self.drain()
+        if messages:
+            return messages
+        if not self._fill():
+            return None
+        return self.drain()
+
+    def next_message(self):
+        while True:
+            message = self._decode_next()
+            if message is not None:
+                return message
+            if not self._fill():
+                return None
+
+
+class QueuedConnection(FramedConnection):
+    # Server side TCP connection. Frames are queued and one writer thread
+    # sends everything pending with a single sendall, so the tick loop and
+    # the other threads never wait on the socket. A snapshot that is still
+    # queued when the next one arrives is replaced by it. A client that
+    # stops reading is shut down once its writer has been stuck for
+    # max_stall seconds or max_pending_bytes are waiting.
+    def __init__(self, sock, buffer_size=DEFAULT_BUFFER_SIZE, max_pending_bytes=MAX_PENDING_BYTES, max_stall=5.0):
+        super().__init__(sock, buffer_size)
+        self.max_pending_bytes = max_pending_bytes
+        self.max_stall = max_stall
+        self.condition = threading.Condition()
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_snapshot = None
+        self.write_started = None
+        self.closed = False
+
+        writer_thread = threading.Thread(target=self.write_pending)
+        writer_thread.daemon = True
+        writer_thread.start()
+
+    def send_frame(self, frame):
+        self.queue_frame(frame)
+
+    def send_snapshot(self, payload):
+        self.queue_frame(encode_snapshot_frame(payload), snapshot=True)
+
+    def queue_frame(self, frame, snapshot=False):
+        with self.condition:
+            if self.closed:
+                raise ConnectionError('Connection is closed')
+            if snapshot and self.pending_snapshot is not None:
+                # The newer snapshot goes to the back so it still follows any message queued in between
+                self.pending_bytes -= len(self.pending[self.pending_snapshot])
+                self.pending[self.pending_snapshot] = None
+                self.superseded_snapshots += 1
+            if snapshot:
+                self.pending_snapshot = len(self.pending)
+            self.pending.append(frame)
+            self.pending_bytes += len(frame)
+            self.last_send_time = time.time()
+
+            stalled = self.write_started is not None and time.monotonic() - self.write_started > self.max_stall
+            if stalled or self.pending_bytes > self.max_pending_bytes:
+                self.abort()
+                raise ConnectionError(f'Client is not reading, {self.pending_bytes} bytes queued')
+            self.condition.notify()
+
+    def write_pending(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    break
+                frames = [frame for frame in self.pending if frame is not None]
+                self.pending = []
+                self.pending_bytes = 0
+                self.pending_snapshot = None
+                self.write_started = time.monotonic()
+
+            data = b''.join(frames)
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                break
+            self.bytes_sent += len(data)
+            self.frames_sent += len(frames)
+            with self.condition:
+                self.write_started = None
+        super().close()
+
+    def abort(self):
+        # Unblocks both the writer and the thread reading from this client, which then disconnects it
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        # The writer sends what is still queued, like a last error message, then closes the socket
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class AsyncFramedConnection(FramedConnection):
+    def __init__(self, reader, writer, buffer_size=DEFAULT_BUFFER_SIZE):
+        super().__init__(writer.get_extra_info('socket'), buffer_size)
+        self.reader = reader
+        self.writer = writer
+
+    def send_frame(self, frame):
+        # StreamWriter.write never blocks, it only appends to the transport buffer
+        self.writer.write(frame)
+        self.bytes_sent += len(frame)
+        self.frames_sent += 1
+        self.last_send_time = time.time()
+
+    def send_snapshot(self, payload):
+        # A client that does not read fills the transport buffer, its snapshots are dropped
+        # until it catches up, the next one is encoded against its last ack anyway
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            self.superseded_snapshots += 1
+            return
+        self.send_frame(encode_snapshot_frame(payload))
+
+    def close(self):
+        self.writer.close()
+
+    async def receive_async(self):
+        messages = self.drain()
+        if messages:
+            return messages
+        data = await self.reader.read(DEFAULT_BUFFER_SIZE)
+        if not data:
+            return None
+        self.bytes_received += len(data)
+        self.feed(data)
+        return self.drain()
@@ -0,0 +1,88 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from simulation_fightinggame import (MOVE_SPEED, GRAVITY, JUMP_SPEED, PLAYER_HALF_WIDTH, SCREEN_MIN_X, SCREEN_MAX_X,
+                                     SUPPORT_TOLERANCE)
+
+VECTOR_PHYSICS_AVAILABLE = np is not None
+
+
+class PlatformArrays:
+    def __init__(self, platforms):
+        self.left = np.array([platform['x'] for platform in platforms], dtype=np.float64)
+        self.right = self.left + np.array([platform['width'] for platform in platforms], dtype=np.float64)
+        self.y = np.array([platform['y'] for platform in platforms], dtype=np.float64)
+
+
+class VectorPhysics:
+    # The same rules as simulation_fightinggame.step_player, but for every
+    # entity at once: positions, velocities and flags live in NumPy arrays
+    # and one step is a handful of array operations instead of a Python loop.
+    def __init__(self):
+        if np is None:
+            raise ImportError('numpy is required for VectorPhysics')
+        self.layouts = {}
+
+    def platform_arrays(self, platform_index):
+        arrays = self.layouts.get(platform_index.layout)
+        if arrays is None:
+            arrays = self.layouts[platform_index.layout] = PlatformArrays(platform_index.platforms)
+        return arrays
+
+    def step_arrays(self, x, y, velocity_y, jumping, facing_right, move, jump, platforms, dt):
+        """Advances every entity by dt. All per-entity arguments are arrays of one length, returns the new arrays."""
+        moving = move != 0
+        x = np.where(moving, np.clip(x + move * MOVE_SPEED * dt, SCREEN_MIN_X, SCREEN_MAX_X), x)
+        facing_right = np.where(moving, move > 0, facing_right)
+
+        # Entity by platform matrices, the stage has a handful of platforms and the entities are the long axis
+        overlapping = ((x[:, None] + PLAYER_HALF_WIDTH > platforms.left[None, :]) &
+                       (x[:, None] - PLAYER_HALF_WIDTH < platforms.right[None, :]))
+        support_y = np.where(overlapping & (np.abs(y[:, None] - platforms.y[None, :]) <= SUPPORT_TOLERANCE),
+                             platforms.y[None, :], np.inf).min(axis=1)
+        supported = np.isfinite(support_y)
+
+        jumping_now = supported & jump
+        grounded = supported & ~jump
+        velocity_y = np.where(jumping_now, -JUMP_SPEED, velocity_y)
+        jumping = jumping | jumping_now
+
+        # Airborne entities fall, the swept check lands them on the highest platform crossed this step
+        falling_velocity = velocity_y + GRAVITY * dt
+        falling_y = y + falling_velocity * dt
+        crossed = (overlapping & (falling_velocity[:, None] > 0) &
+                   (y[:, None] <= platforms.y[None, :]) & (platforms.y[None, :] <= falling_y[:, None]))
+        landing_y = np.where(crossed, platforms.y[None, :], np.inf).min(axis=1)
+        landed = np.isfinite(landing_y)
+
+        y = np.where(grounded, support_y, np.where(landed, landing_y, falling_y))
+        velocity_y = np.where(grounded | landed, 0.0, falling_velocity)
+        jumping = np.where(grounded | landed, False, jumping)
+        return x, y, velocity_y, jumping, facing_right
+
+    def step_players(self, movers, dt):
+        """movers is a list of (player, inputs, platform_index), the PlayerStates are updated in place."""
+        layouts = {}
+        for mover in movers:
+            layouts.setdefault(mover[2].layout, []).append(mover)
+
+        for group in layouts.values():
+            count = len(group)
+            players = [player for player, inputs, platform_index in group]
+            inputs = [inputs for player, inputs, platform_index in group]
+
+            x, y, velocity_y, jumping, facing_right = self.step_arrays(
+                np.fromiter((player.x for player in players), np.float64, count),
+                np.fromiter((player.y for player in players), np.float64, count),
+                np.fromiter((player.velocity_y for player in players), np.float64, count),
+                np.fromiter((player.is_jumping for player in players), bool, count),
+                np.fromiter((player.facing_right for player in players), bool, count),
+                np.fromiter((entry.get('move', 0) for entry in inputs), np.float64, count),
+                np.fromiter((bool(entry.get('jump')) for entry in inputs), bool, count),
+                self.platform_arrays(group[0][2]), dt)
+
+            for player, *values in zip(players, x.tolist(), y.tolist(), velocity_y.tolist(),
+                                       jumping.tolist(), facing_right.tolist()):
+                player.x, player.y, player.velocity_y, player.is_jumping, player.facing_right = values
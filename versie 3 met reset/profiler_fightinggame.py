@@ -0,0 +1,79 @@
+import csv
+import time
+from collections import deque
+
+# The parts of a client frame, in the order run_game goes through them.
+# wait is the time clock.tick sleeps to hold the frame rate, everything
+# before it is the work that has to fit in the frame budget.
+STAGES = ('events', 'network', 'prediction', 'background', 'platforms', 'characters', 'ui', 'present', 'wait')
+STAGE_INDEX = {stage: index for index, stage in enumerate(STAGES)}
+WAIT = STAGE_INDEX['wait']
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class FrameProfiler:
+    # mark(stage) adds the time since the previous mark to that stage, so a
+    # frame is a handful of perf_counter calls. Finished frames are kept as
+    # rows of stage seconds for the overlay and the CSV export.
+    def __init__(self, history=3600):
+        self.frames = deque(maxlen=history)
+        self.frame_count = 0
+        self.started = time.perf_counter()
+        self.frame_start = None
+        self.last_mark = None
+        self.current = None
+
+    def begin_frame(self):
+        # A frame that was left with continue is dropped and the next one starts clean
+        self.frame_start = self.last_mark = time.perf_counter()
+        self.current = [0.0] * len(STAGES)
+
+    def mark(self, stage):
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        self.current[STAGE_INDEX[stage]] += now - self.last_mark
+        self.last_mark = now
+
+    def end_frame(self):
+        """Stores the frame, returns (total seconds, work seconds) or None when no frame was begun."""
+        if self.current is None:
+            return None
+        total = self.last_mark - self.frame_start
+        self.frames.append((self.frame_start - self.started, total, self.current))
+        self.frame_count += 1
+        self.current = None
+        return total, total - self.frames[-1][2][WAIT]
+
+    def summary_lines(self, window=120):
+        """Text for the overlay: FPS, work time percentiles and the mean of every stage over the last frames."""
+        frames = list(self.frames)[-window:]
+        if not frames:
+            return ['no frames yet']
+        totals = [total for start, total, stages in frames]
+        work = [total - stages[WAIT] for start, total, stages in frames]
+        fps = len(totals) / sum(totals) if sum(totals) else 0.0
+        lines = [f'{fps:5.1f} fps   work ms p50 {percentile(work, 0.5) * 1000:5.2f}  '
+                 f'p99 {percentile(work, 0.99) * 1000:5.2f}  max {max(work) * 1000:5.2f}']
+        for index, stage in enumerate(STAGES):
+            mean = sum(stages[index] for start, total, stages in frames) / len(frames)
+            lines.append(f'{stage:>10} {mean * 1000:6.2f} ms')
+        return lines
+
+    def export_csv(self, path):
+        """Writes one row per stored frame with every stage in milliseconds, returns the number of rows."""
+        frames = list(self.frames)
+        first_frame = self.frame_count - len(frames)
+        with open(path, 'w', newline='') as trace_file:
+            writer = csv.writer(trace_file)
+            writer.writerow(['frame', 'start_s', 'total_ms', 'work_ms'] + [f'{stage}_ms' for stage in STAGES])
+            for number, (start, total, stages) in enumerate(frames, first_frame):
+                writer.writerow([number, f'{start:.4f}', f'{total * 1000:.3f}', f'{(total - stages[WAIT]) * 1000:.3f}']
+                                + [f'{seconds * 1000:.3f}' for seconds in stages])
+        return len(frames)
@@ -0,0 +1,61 @@
+class DirtyRectRenderer:
+    # Only the parts of the screen that changed since the last frame are
+    # redrawn and handed to pygame.display.update. The static scene
+    # (background and platforms) is kept in one surface and used to erase
+    # the spot an item was drawn at in the previous frame.
+    def __init__(self, screen):
+        self.screen = screen
+        self.scene = None
+        self.drawn = {}
+        self.full_redraw = True
+
+    def set_scene(self, scene):
+        self.scene = scene
+        self.full_redraw = True
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def render(self, drawables):
+        """drawables is a list of (key, rect, signature, draw) in drawing order, returns the rects to update."""
+        current = {key: (rect, signature) for key, rect, signature, draw in drawables}
+
+        if self.full_redraw:
+            self.screen.blit(self.scene, (0, 0))
+            for key, rect, signature, draw in drawables:
+                draw()
+            self.drawn = current
+            self.full_redraw = False
+            return [self.screen.get_rect()]
+
+        changed = set()
+        dirty = []
+        for key, rect, signature, draw in drawables:
+            if self.drawn.get(key) != (rect, signature):
+                changed.add(key)
+                dirty.append(rect)
+                if key in self.drawn:
+                    dirty.append(self.drawn[key][0])
+        for key, (rect, signature) in self.drawn.items():
+            if key not in current:
+                dirty.append(rect)
+
+        # An unchanged item that overlaps an erased area is erased and drawn again as a whole,
+        # redrawing only half of a sprite with alpha would blend it twice
+        grown = True
+        while grown:
+            grown = False
+            for key, rect, signature, draw in drawables:
+                if key not in changed and rect.collidelist(dirty) != -1:
+                    changed.add(key)
+                    dirty.append(rect)
+                    grown = True
+
+        for area in dirty:
+            self.screen.blit(self.scene, area, area)
+        for key, rect, signature, draw in drawables:
+            if key in changed:
+                draw()
+
+        self.drawn = current
+        return dirty
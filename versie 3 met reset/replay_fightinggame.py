@@ -0,0 +1,323 @@
+import argparse
+import csv
+import logging
+import os
+import pickle
+import struct
+import sys
+import time
+import zlib
+
+from codec_fightinggame import player_record, encode_ack, decode_ack, encode_input, decode_input
+from network_fightinggame import encode_frame, HEADER, KIND_PICKLE, KIND_ACK, KIND_INPUT
+from room_fightinggame import Room
+
+# A replay is everything one room did: the messages it handled, players
+# joining and leaving and the times it was ticked at. Those are its only
+# inputs, so a fresh Room fed the same entries ends up in the same state.
+# Every tick entry carries a checksum of the players after the tick, a
+# replay that comes out different says exactly which tick diverged.
+REPLAY_MAGIC = b'GIPR'
+REPLAY_VERSION = 1
+FILE_HEADER = struct.Struct('!4sBdd')
+ENTRY_KIND = struct.Struct('!B')
+TICK_ENTRY = struct.Struct('!BdBI')
+PLAYER_ENTRY = struct.Struct('!BB')
+# Followed by the message as one frame, inputs and acks packed the way they travel over the network
+MESSAGE_ENTRY = struct.Struct('!BBId')
+STATE_RECORD = struct.Struct('!BddddBI')
+
+ENTRY_TICK = 0
+ENTRY_JOIN = 1
+ENTRY_LEAVE = 2
+ENTRY_MESSAGE = 3
+
+INPUT_KEYS = {'sequence', 'move', 'jump'}
+
+
+def state_checksum(players):
+    return zlib.crc32(b''.join(STATE_RECORD.pack(player_num, *player_record(player))
+                               for player_num, player in sorted(players.items())))
+
+
+def encode_message_frame(message):
+    try:
+        if message.keys() == {'ack'}:
+            return encode_frame(encode_ack(message['ack']), KIND_ACK)
+        action = message.get('player_action')
+        if message.keys() == {'player_action'} and isinstance(action, dict) and action.keys() == INPUT_KEYS:
+            return encode_frame(encode_input(action['sequence'], action['move'], action['jump']), KIND_INPUT)
+    except struct.error:
+        # A value the compact layout can not hold is kept exactly in a pickle
+        pass
+    return encode_frame(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def decode_message_frame(kind, payload):
+    if kind == KIND_ACK:
+        return decode_ack(payload)
+    if kind == KIND_INPUT:
+        return decode_input(payload)
+    if kind == KIND_PICKLE:
+        return pickle.loads(payload)
+    raise ValueError(f'Unknown frame kind {kind} in replay')
+
+
+def create_replay_file(path):
+    """Opens a new file at path, or next to it with a number added when path exists, returns (path, file)."""
+    base, extension = os.path.splitext(path)
+    number = 1
+    while True:
+        try:
+            return path, open(path, 'xb')
+        except FileExistsError:
+            number += 1
+            path = f'{base}_{number}{extension}'
+
+
+class ReplayRecorder:
+    # Writes the entries of one room to a new replay file. The room calls it
+    # with its lock held, so entries are written in the order they happened.
+    # Writes are buffered, the file is flushed when a match ends and closed
+    # with the room. An existing file is never written to, a replay holds
+    # exactly one recording.
+    def __init__(self, path, tick_interval, broadcast_interval):
+        self.path, self.file = create_replay_file(path)
+        self.file.write(FILE_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, tick_interval, broadcast_interval))
+
+    def join(self, player_num):
+        self.file.write(PLAYER_ENTRY.pack(ENTRY_JOIN, player_num))
+
+    def leave(self, player_num):
+        self.file.write(PLAYER_ENTRY.pack(ENTRY_LEAVE, player_num))
+
+    def message(self, player_num, tick, received_time, message):
+        self.file.write(MESSAGE_ENTRY.pack(ENTRY_MESSAGE, player_num, tick, received_time))
+        self.file.write(encode_message_frame(message))
+
+    def tick(self, current_time, steps, players):
+        self.file.write(TICK_ENTRY.pack(ENTRY_TICK, current_time, steps, state_checksum(players)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def read_replay(path):
+    """Returns (tick_interval, broadcast_interval) and the list of entries of a replay file.
+
+    Entries are (ENTRY_TICK, current_time, steps, checksum), (ENTRY_JOIN, player_num),
+    (ENTRY_LEAVE, player_num) and (ENTRY_MESSAGE, player_num, tick, received_time, message).
+    A last entry that was only partly written is left out.
+    """
+    with open(path, 'rb') as replay_file:
+        data = replay_file.read()
+    if len(data) < FILE_HEADER.size:
+        raise ValueError(f'{path} is not a version {REPLAY_VERSION} replay')
+    magic, version, tick_interval, broadcast_interval = FILE_HEADER.unpack_from(data, 0)
+    if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+        raise ValueError(f'{path} is not a version {REPLAY_VERSION} replay')
+
+    entries = []
+    offset = FILE_HEADER.size
+    try:
+        while offset < len(data):
+            if data.startswith(REPLAY_MAGIC, offset):
+                # Older recorders appended a new session to an existing file
+                raise ValueError(f'{path} holds a second recording starting at byte {offset}')
+            kind = ENTRY_KIND.unpack_from(data, offset)[0]
+            if kind == ENTRY_TICK:
+                entries.append(TICK_ENTRY.unpack_from(data, offset))
+                offset += TICK_ENTRY.size
+            elif kind in (ENTRY_JOIN, ENTRY_LEAVE):
+                entries.append(PLAYER_ENTRY.unpack_from(data, offset))
+                offset += PLAYER_ENTRY.size
+            elif kind == ENTRY_MESSAGE:
+                header = MESSAGE_ENTRY.unpack_from(data, offset)
+                length, frame_kind = HEADER.unpack_from(data, offset + MESSAGE_ENTRY.size)
+                payload_start = offset + MESSAGE_ENTRY.size + HEADER.size
+                if payload_start + length > len(data):
+                    break
+                message = decode_message_frame(frame_kind, data[payload_start:payload_start + length])
+                entries.append(header + (message,))
+                offset = payload_start + length
+            else:
+                raise ValueError(f'Unknown replay entry {kind} at byte {offset}')
+    except struct.error:
+        pass
+    return (tick_interval, broadcast_interval), entries
+
+
+class ReplayConnection:
+    # Stands in for a client, keeps the control messages the room sends it
+    datagram = None
+    datagram_token = None
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def send_snapshot(self, payload):
+        pass
+
+    def idle_time(self, now):
+        return 0.0
+
+    def close(self):
+        pass
+
+
+class ReplayRoom(Room):
+    def broadcast_game_state(self, current_time):
+        # Nobody receives the snapshots, but the capture times are what recorded acks measure against
+        self.snapshots.capture(self.game_state['players'], current_time)
+
+
+class MatchSummary:
+    def __init__(self, number, start_tick, start_time, characters):
+        self.number = number
+        self.start_tick = start_tick
+        self.start_time = start_time
+        # Still None when the recording stops during the match
+        self.end_tick = None
+        self.last_time = start_time
+        self.winner = None
+        self.characters = characters
+        self.attacks = {1: 0, 2: 0}
+        self.hits = {1: 0, 2: 0}
+        self.damage = {1: 0.0, 2: 0.0}
+
+    def describe(self):
+        duration = self.last_time - self.start_time
+        if self.end_tick is None:
+            result = 'unfinished'
+        else:
+            result = f'player {self.winner} wins' if self.winner else 'no winner'
+        players = ', '.join(f'P{player_num} {self.characters.get(player_num)}: {self.hits[player_num]}/'
+                            f'{self.attacks[player_num]} hits, {self.damage[player_num]:.0f} damage'
+                            for player_num in (1, 2))
+        return f'match {self.number}: {duration:5.1f} s, {result} - {players}'
+
+
+class ReplayPlayer:
+    # Re-simulates a replay as fast as the entries can be applied. on_tick,
+    # when given, is called as on_tick(room, current_time) after every tick,
+    # for traces or for drawing highlights.
+    def __init__(self, path, logger=None):
+        self.path = path
+        (self.tick_interval, self.broadcast_interval), self.entries = read_replay(path)
+        if logger is None:
+            logger = logging.getLogger('GameReplay')
+        self.room = ReplayRoom(0, logger, tick_interval=self.tick_interval, broadcast_interval=self.broadcast_interval)
+        self.matches = []
+        self.desyncs = []
+        self.ticks = 0
+        self.simulated_time = 0.0
+
+    def run(self, on_tick=None):
+        room = self.room
+        players = room.game_state['players']
+        first_time = None
+        match = None
+
+        for entry in self.entries:
+            kind = entry[0]
+            if kind == ENTRY_TICK:
+                kind, current_time, steps, checksum = entry
+                if first_time is None:
+                    first_time = current_time
+                was_playing = room.match_started
+                room.tick(current_time, steps)
+                self.ticks += 1
+                if state_checksum(players) != checksum:
+                    self.desyncs.append((self.ticks, room.tick_count))
+
+                if room.match_started and not was_playing:
+                    match = MatchSummary(len(self.matches) + 1, room.tick_count, current_time,
+                                         {player_num: player.character for player_num, player in players.items()})
+                    self.matches.append(match)
+                if match is not None and match.end_tick is None:
+                    match.last_time = current_time
+                    if room.game_over_state or not room.match_started:
+                        match.end_tick = room.tick_count
+                        dead = [player_num for player_num, player in players.items() if player.is_dead]
+                        if len(dead) == 1:
+                            match.winner = 1 if dead[0] == 2 else 2
+                if on_tick is not None:
+                    on_tick(room, current_time)
+                self.simulated_time = current_time - first_time
+
+            elif kind == ENTRY_JOIN:
+                player_num = room.add_client(ReplayConnection())
+                if player_num != entry[1]:
+                    raise ValueError(f'Replay joined player {entry[1]} but the room assigned {player_num}')
+
+            elif kind == ENTRY_LEAVE:
+                room.handle_disconnect(entry[1])
+
+            elif kind == ENTRY_MESSAGE:
+                kind, player_num, tick, received_time, message = entry
+                action = message.get('player_action') if isinstance(message, dict) else None
+                attacking = match is not None and match.end_tick is None and isinstance(action, dict) and action.get('attack')
+                if attacking:
+                    defender = players.get(1 if player_num == 2 else 2)
+                    health = defender.health if defender else None
+                try:
+                    room.handle_message(player_num, message, received_time)
+                except Exception:
+                    # The live server dropped the client on the same error, the leave entry follows
+                    continue
+                if attacking and player_num in match.attacks:
+                    match.attacks[player_num] += 1
+                    if defender is not None and defender.health < health:
+                        match.hits[player_num] += 1
+                        match.damage[player_num] += health - defender.health
+        return self.matches
+
+
+def write_positions(path):
+    """Returns an on_tick callback that writes every player position to a CSV file, and the file."""
+    trace_file = open(path, 'w', newline='')
+    writer = csv.writer(trace_file)
+    writer.writerow(['tick', 'time', 'player', 'x', 'y', 'health', 'facing_right', 'is_attacking', 'is_dead'])
+
+    def on_tick(room, current_time):
+        if room.match_started:
+            for player_num, player in room.game_state['players'].items():
+                writer.writerow([room.tick_count, f'{current_time:.4f}', player_num, f'{player.x:.2f}',
+                                 f'{player.y:.2f}', f'{player.health:.1f}', int(player.facing_right),
+                                 int(player.is_attacking), int(player.is_dead)])
+    return on_tick, trace_file
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-simulate a recorded room without a server')
+    parser.add_argument('replay')
+    parser.add_argument('--positions', help='write every player position per tick to this CSV file')
+    parser.add_argument('--verbose', action='store_true', help='show the room log while replaying')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s [REPLAY] %(message)s',
+                        datefmt='%H:%M:%S')
+    player = ReplayPlayer(args.replay)
+    on_tick, trace_file = write_positions(args.positions) if args.positions else (None, None)
+    start = time.perf_counter()
+    matches = player.run(on_tick)
+    elapsed = time.perf_counter() - start
+    if trace_file:
+        trace_file.close()
+
+    print(f'{len(player.entries)} entries, {player.ticks} ticks, {player.simulated_time:.1f} s of play '
+          f'replayed in {elapsed:.2f} s')
+    for match in matches:
+        print(match.describe())
+    if player.desyncs:
+        ticks, tick_count = player.desyncs[0]
+        print(f'DESYNC: {len(player.desyncs)} ticks differ from the recording, first at room tick {tick_count}')
+        sys.exit(1)
+    print('Every tick matches the recorded state')
@@ -0,0 +1,429 @@
+import math
+import threading
+import time
+import logging
+from collections import deque
+
+from codec_fightinggame import SnapshotEncoder
+from character_stats_fightinggame import character_stats
+from combat_fightinggame import PositionHistory, in_reach, knock_back, COOLDOWN_TOLERANCE
+from interpolation_fightinggame import MAX_INTERPOLATION_DELAY
+from metrics_fightinggame import ServerMetrics
+from network_fightinggame import RttEstimator
+from telemetry_fightinggame import telemetry
+from simulation_fightinggame import step_player, PlatformIndex, PlayerState, DEATH_DEPTH
+
+
+class RoomLogAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f'[room {self.extra["room_id"]}] {msg}', kwargs
+
+
+class Room:
+    def __init__(self, room_id, logger, tick_interval=1 / 60, broadcast_interval=1 / 60, metrics=None,
+                 recorder=None):
+        self.room_id = room_id
+        self.logger = RoomLogAdapter(logger, {'room_id': room_id})
+        # Shared by every room of a server, the phases below are timed into it
+        self.metrics = metrics or ServerMetrics()
+        # Writes a replay of every message and tick when the server records matches
+        self.recorder = recorder
+        # A broken connection fails every tick, those errors are rate limited across all rooms
+        self.send_errors = telemetry.channel('room.send', logger, max_per_second=1)
+        self.lock = threading.RLock()
+
+        self.clients = {}
+        self.game_state = {
+            'players': {},
+            'ready': 0
+        }
+        self.match_started = False
+        # Numbered inputs are queued and applied one per tick, inputs holds the
+        # last applied input so a late packet repeats it instead of stopping.
+        self.inputs = {}
+        self.input_queues = {}
+        self.received_inputs = {}
+        self.max_queued_inputs = 8
+        self.tick_interval = tick_interval
+        self.tick_count = 0
+        self.snapshots = SnapshotEncoder()
+        self.client_acks = {}
+        # Round trips are measured from snapshot acks while playing and from heartbeat pongs otherwise
+        self.rtt = {}
+        # Snapshots go out every broadcast_ticks simulation steps. Comparing tick
+        # times against the interval skipped a broadcast whenever a tick came in
+        # a little early.
+        self.broadcast_interval = broadcast_interval
+        self.broadcast_ticks = max(1, round(broadcast_interval / tick_interval))
+        self.last_broadcast_tick = 0
+        self.game_over_state = False
+        self.game_over_time = 0
+        self.game_over_resend_interval = 0.1
+        # Hits are checked against the defender's position at the moment the attacker saw,
+        # at most max_rewind seconds back
+        self.max_rewind = 0.5
+        self.history = PositionHistory(int(self.max_rewind / tick_interval) + 1)
+        self.attack_times = {}
+        self.platforms = []
+        self.init_platforms()
+
+    def init_platforms(self):
+        self.platforms = [
+            {'x': 200, 'y': 600, 'width': 600, 'height': 20},
+            {'x': 400, 'y': 300, 'width': 100, 'height': 20},
+            {'x': 600, 'y': 450, 'width': 100, 'height': 20}
+        ]
+        self.game_state['platforms'] = self.platforms
+        self.platform_index = PlatformIndex(self.platforms)
+
+    def is_full(self):
+        return len(self.clients) >= 2
+
+    def is_empty(self):
+        return not self.clients
+
+    def needs_tick(self):
+        return self.match_started or self.game_over_state or self.game_state['ready'] >= 2
+
+    def add_client(self, connection):
+        player_num = 1 if 1 not in self.clients else 2
+        self.clients[player_num] = connection
+
+        self.game_state['players'][player_num] = PlayerState(player_num)
+        if self.recorder is not None:
+            self.recorder.join(player_num)
+
+        connection.send({'status':'connected', 'player_num': player_num, 'room': self.room_id})
+        return player_num
+
+    def handle_message(self, player_num, client_data, received_time=None):
+        # A replay passes the recorded time, round trips feed into how far a hit can be rewound
+        if received_time is None:
+            received_time = time.time()
+        if self.recorder is not None:
+            self.recorder.message(player_num, self.tick_count, received_time, client_data)
+
+        if 'ack' in client_data:
+            # Acks sent over UDP can be reordered, only a newer one may move the baseline
+            if client_data['ack'] > self.client_acks.get(player_num, 0):
+                self.client_acks[player_num] = client_data['ack']
+                captured = self.snapshots.capture_time(client_data['ack'])
+                if captured is not None:
+                    self.rtt.setdefault(player_num, RttEstimator()).add(received_time - captured)
+
+        elif 'pong' in client_data:
+            self.rtt.setdefault(player_num, RttEstimator()).add(received_time - client_data['pong'])
+
+        elif 'player_action' in client_data:
+            action = client_data['player_action']
+            start = time.perf_counter()
+            self.process_action(player_num, action)
+            self.metrics.observe('process_action', time.perf_counter() - start)
+
+            if 'attack' in action and action['attack']:
+                start = time.perf_counter()
+                self.handle_attack(player_num, action)
+                self.metrics.observe('handle_attack', time.perf_counter() - start)
+
+        elif 'character_select' in client_data:
+            self.game_state['players'][player_num].character = client_data['character_select']
+            self.logger.info(f'Player {player_num} selected character: {client_data['character_select']}')
+
+        elif 'ready' in client_data and client_data['ready']:
+            self.game_state['ready'] += 1
+            self.logger.info(f"Player {player_num} is ready. Ready count: {self.game_state['ready']}")
+
+        elif 'player_died' in client_data and client_data['player_died']:
+            self.game_state['players'][player_num].is_dead = True
+            self.logger.info(f'Player {player_num} died!')
+
+        if 'reset_game' in client_data and client_data['reset_game']:
+            self.reset_game()
+            self.logger.info(f"Game reset requested by player {player_num}")
+
+    def send_heartbeats(self, current_time, interval):
+        # Only a link nothing was sent on for a while gets one, the pong it asks for measures the round trip
+        for player_num, connection in list(self.clients.items()):
+            if connection.idle_time(current_time) < interval:
+                continue
+            try:
+                connection.send({'status': 'heartbeat', 'ping': current_time})
+            except Exception as e:
+                self.logger.info(f'Heartbeat failed for player{player_num}: {str(e)}')
+
+    def rewind_limit(self, player_num):
+        # A client can only be looking back its round trip plus the longest interpolation delay
+        rtt = self.rtt.get(player_num)
+        if rtt is None:
+            return self.max_rewind
+        return min(self.max_rewind, rtt.smoothed + 4 * rtt.jitter + MAX_INTERPOLATION_DELAY)
+
+    def handle_attack(self, attacker_num, action):
+        if not self.match_started:
+            return
+
+        attacker = self.game_state['players'][attacker_num]
+        defender_num = 1 if attacker_num == 2 else 2
+        defender = self.game_state['players'].get(defender_num)
+        if defender is None or attacker.is_dead:
+            return
+
+        # The defender is rewound to where the attacker saw them, the history limits how far back that goes
+        position = None
+        newest_time = self.history.newest_time()
+        if 'view_time' in action and newest_time is not None:
+            view_time = max(action['view_time'], newest_time - self.rewind_limit(attacker_num))
+            position = self.history.position_at(defender_num, view_time)
+        defender_x, defender_y = position or (defender.x, defender.y)
+
+        attacks = []
+        if action.get('is_attacking') or not action.get('is_special_attacking'):
+            attacks.append(False)
+        if action.get('is_special_attacking'):
+            attacks.append(True)
+
+        # Damage, range and cooldown come from the character table, the client only says which attack it used
+        now = self.tick_count * self.tick_interval
+        stats = character_stats(attacker.character)
+        for special in attacks:
+            attack = stats.attack(special)
+            last_attack = self.attack_times.get((attacker_num, special), -math.inf)
+            if now - last_attack < attack.cooldown - COOLDOWN_TOLERANCE:
+                continue
+            self.attack_times[(attacker_num, special)] = now
+
+            if defender.is_dead or not in_reach(attacker, defender_x, defender_y, attack.range):
+                continue
+            defender.health = max(0, defender.health - attack.damage_for(attacker.health / 100,
+                                                                         abs(defender_x - attacker.x)))
+            knock_back(attacker, defender, attack.knockback)
+
+            if defender.health <= 0:
+                defender.is_dead = True
+                self.logger.info(f'Player {defender_num} defeated!')
+
+    def process_action(self, player_num, action):
+        player = self.game_state['players'][player_num]
+
+        # Attacks come over TCP without a sequence number, a late or repeated
+        # input datagram must not be able to drop them
+        if 'is_attacking' in action:
+            player.is_attacking = action['is_attacking']
+        if 'is_special_attacking' in action:
+            player.is_special_attacking = action['is_special_attacking']
+
+        # Only inputs are taken from the client, positions come from step()
+        sequence = action.get('sequence', 0)
+        if sequence:
+            if sequence <= self.received_inputs.get(player_num, 0):
+                return
+            self.received_inputs[player_num] = sequence
+
+        if 'move' in action or 'jump' in action:
+            inputs = dict(self.inputs.get(player_num, {}))
+            if 'move' in action:
+                inputs['move'] = max(-1, min(1, int(action['move'])))
+            if 'jump' in action:
+                inputs['jump'] = bool(action['jump'])
+
+            queue = self.input_queues.setdefault(player_num, deque())
+            queue.append((sequence, inputs))
+            while len(queue) > self.max_queued_inputs:
+                queue.popleft()
+
+    def broadcast_game_state(self, current_time):
+        self.snapshots.capture(self.game_state['players'], current_time)
+        for player_num, connection in self.clients.items():
+            try:
+                payload = self.snapshots.encode(self.client_acks.get(player_num))
+                (connection.datagram or connection).send_snapshot(payload)
+            except Exception as e:
+                self.metrics.count('send_errors')
+                self.send_errors.error('[room %s] Error sending game state: %s', self.room_id, e)
+
+    def handle_disconnect(self, player_num):
+        self.logger.info(f'Player {player_num} disconnected')
+        if self.recorder is not None:
+            self.recorder.leave(player_num)
+        if player_num in self.clients:
+            connection = self.clients.pop(player_num)
+            try:
+                connection.send({
+                    'status': 'server_error',
+                    'message': 'Server disconnection occurred'
+                })
+            except Exception:
+                pass
+            finally:
+                # A stalled client refuses the farewell, its socket still has to be closed
+                connection.close()
+        self.client_acks.pop(player_num, None)
+        self.rtt.pop(player_num, None)
+        self.inputs.pop(player_num, None)
+        self.input_queues.pop(player_num, None)
+        self.received_inputs.pop(player_num, None)
+
+        if player_num in self.game_state['players']:
+            self.game_state['players'][player_num].connected = False
+
+        other_player = 1 if player_num == 2 else 2
+        if other_player in self.clients:
+            try:
+                self.clients[other_player].send({
+                    'status': 'server_error',
+                    'message': f'Player {player_num} disconnected'
+                })
+            except Exception:
+                pass
+
+        if self.match_started:
+            self.match_started = False
+            self.game_state['ready'] = 0
+            self.logger.info('Match ended due to player disconnect')
+
+        if not self.clients:
+            self.game_state['players'].clear()
+            self.game_state['ready'] = 0
+            self.game_over_state = False
+
+    def prepare_step(self):
+        """Takes the next queued input of every live player, returns (player_num, player, inputs) to simulate."""
+        self.tick_count += 1
+        movers = []
+        for player_num, player in self.game_state['players'].items():
+            if player.is_dead or not player.connected:
+                continue
+
+            queue = self.input_queues.get(player_num)
+            if queue:
+                sequence, self.inputs[player_num] = queue.popleft()
+                if sequence:
+                    player.last_input = sequence
+            movers.append((player_num, player, self.inputs.get(player_num, {})))
+        return movers
+
+    def check_deaths(self, movers):
+        death_y = self.platform_index.lowest_y + DEATH_DEPTH
+        for player_num, player, inputs in movers:
+            if player.y > death_y:
+                player.is_dead = True
+                player.health = 0
+                self.logger.info(f'Player {player_num} fell off the stage!')
+
+    def step(self):
+        movers = self.prepare_step()
+        for player_num, player, inputs in movers:
+            step_player(player, inputs, self.platform_index, self.tick_interval)
+        self.check_deaths(movers)
+
+    def tick(self, current_time, steps=1):
+        self.start_match_if_ready()
+        if self.match_started:
+            for _ in range(steps):
+                self.step()
+        self.finish_tick(current_time)
+        self.record_tick(current_time, steps)
+
+    def record_tick(self, current_time, steps):
+        if self.recorder is not None:
+            self.recorder.tick(current_time, steps, self.game_state['players'])
+
+    def start_match_if_ready(self):
+        if not self.match_started and self.game_state['ready'] >= 2:
+            self.logger.info('Both players ready, starting match!')
+            self.match_started = True
+            self.received_inputs.clear()
+            self.history.clear()
+            self.attack_times.clear()
+            self.reset_snapshots()
+
+            for connection in self.clients.values():
+                connection.send({
+                    "status": "match_start",
+                    "game_state": self.game_state_message()
+                })
+
+    def finish_tick(self, current_time):
+        if self.match_started:
+            self.history.record(current_time, self.game_state['players'])
+            if self.tick_count - self.last_broadcast_tick >= self.broadcast_ticks:
+                start = time.perf_counter()
+                self.broadcast_game_state(current_time)
+                self.metrics.observe('broadcast', time.perf_counter() - start)
+                self.last_broadcast_tick = self.tick_count
+
+            game_over = False
+            winner = None
+
+            for player_num, player_data in self.game_state['players'].items():
+                if player_data.is_dead:
+                    game_over = True
+                    winner = 1 if player_num == 2 else 2
+                    break
+
+            if game_over and current_time - self.game_over_time >= self.game_over_resend_interval:
+                if not self.game_over_state:
+                    self.logger.info(f'Game_over! Player {winner} wins!')
+                    if self.recorder is not None:
+                        self.recorder.flush()
+                self.game_over_state = True
+                self.game_over_time = current_time
+                for connection in self.clients.values():
+                    try:
+                        connection.send({
+                            "status": 'game_over',
+                            'winner': winner,
+                            'game_state': self.game_state_message()
+                        })
+                    except Exception as e:
+                        self.metrics.count('send_errors')
+                        self.send_errors.error('[room %s] Error sending game_over: %s', self.room_id, e)
+
+        if self.game_over_state and current_time - self.game_over_time >= 5:
+            self.game_over_state = False
+            if self.match_started:
+                self.match_started = False
+                self.game_state['ready'] = 0
+
+            for player_num, player in self.game_state['players'].items():
+                player.respawn(player_num)
+            self.logger.info('Game reset for new match')
+
+    def game_state_message(self):
+        # Clients get plain dicts in pickled messages, the PlayerState records stay on the server
+        message = dict(self.game_state)
+        message['players'] = {player_num: player.as_dict() for player_num, player in self.game_state['players'].items()}
+        return message
+
+    def reset_snapshots(self):
+        self.snapshots.reset()
+        self.client_acks.clear()
+
+    def reset_game(self):
+        self.match_started = False
+        self.game_over_state = False
+        self.game_state['ready'] = 0
+        self.inputs.clear()
+        self.input_queues.clear()
+        self.received_inputs.clear()
+        self.reset_snapshots()
+
+        for player_num, player in self.game_state['players'].items():
+            player.reset(player_num)
+        for connection in self.clients.values():
+            try:
+                connection.send({
+                    'status': 'game_reset',
+                    "game_state": self.game_state_message()
+                })
+            except Exception as e:
+                self.logger.error(f'Error sending game reset: {e}')
+
+        self.logger.info("Game fully reset - returning to character selection")
+
+    def close(self):
+        for connection in list(self.clients.values()):
+            connection.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
@@ -1,100 +1,132 @@
+import os
 import socket
-import pickle
 import threading
 import time
 import logging
+import secrets
+from contextlib import ExitStack
+
+from network_fightinggame import (QueuedConnection, ProtocolError, DatagramChannel, decode_datagram,
+                                  MAX_DATAGRAM_SIZE, KIND_SNAPSHOT)
+from room_fightinggame import Room
+from simulation_fightinggame import FixedTimestep
+from physics_fightinggame import VectorPhysics
+from metrics_fightinggame import ServerMetrics, start_stats_endpoint
+from replay_fightinggame import ReplayRecorder
+from telemetry_fightinggame import telemetry, install_dump_signal
 
 class GameServer:
-    def __init__(self, host='0.0.0.0', port=5555):
+    def __init__(self, host='0.0.0.0', port=5555, max_rooms=500, tick_rate=60, broadcast_rate=60, udp=True,
+                 vector_physics=False, heartbeat_interval=1.0, stats_port=None, record_dir=None):
         logging.basicConfig(level=logging.INFO,
                             format='%(asctime)s [SERVER] %(message)s',
                             datefmt='%H:%M:%S')
         self.logger = logging.getLogger('GameServer')
+        self.tick_telemetry = telemetry.channel('server.tick', self.logger)
+        self.overrun_telemetry = telemetry.channel('server.overrun', self.logger, max_per_second=1)
+        self.datagram_errors = telemetry.channel('server.datagrams', self.logger, max_per_second=1)
+
+        # Phase latencies and counters for the whole server, served as JSON on
+        # 127.0.0.1:stats_port when a port is given
+        self.metrics = ServerMetrics()
+        self.stats_port = stats_port
+        self.stats_endpoint = None
+
+        # Every room writes a replay file to record_dir when one is given
+        self.record_dir = record_dir
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
 
         self.host = host
         self.port = port
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.clients = {}
-        self.client_characters = {}
-        self.game_state = {
-            'players': {},
-            'ready': 0
-        }
-        self.match_started = False
-        self.platforms = []
-        self.init_platforms()
+
+        # Every match lives in its own Room. waiting_rooms holds rooms with a
+        # free slot in creation order, active_rooms the rooms the tick loop has
+        # to visit, so idle and waiting rooms are never touched per tick.
+        self.max_rooms = max_rooms
+        self.rooms = {}
+        self.waiting_rooms = {}
+        self.active_rooms = {}
+        self.next_room_id = 1
+        self.rooms_lock = threading.RLock()
+
+        # The simulation runs at tick_rate, snapshots are sent at broadcast_rate
+        self.tick_rate = tick_rate
+        self.broadcast_rate = broadcast_rate
+        self.clock = FixedTimestep(tick_rate)
+        self.heartbeat_interval = heartbeat_interval
+        # With numpy installed every room can be stepped in one batch instead of player by player
+        self.physics = VectorPhysics() if vector_physics else None
+
+        # Snapshots and movement inputs can use UDP on the same port number.
+        # Every client gets a token over TCP, datagrams carrying it are
+        # mapped back to that client, the sender address is learned from them.
+        self.udp = udp
+        self.udp_socket = None
+        self.datagram_clients = {}
         self.logger.info(f'Initializing server on {host}:{port}')
 
-    def init_platforms(self):
-        self.platforms = [
-            {'x': 200, 'y': 600, 'width': 600, 'height': 20},
-            {'x': 400, 'y': 300, 'width': 100, 'height': 20},
-            {'x': 600, 'y': 450, 'width': 100, 'height': 20}
-        ]
-        self.game_state['platforms'] = self.platforms
+    def open_listener(self, backlog=2):
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen(backlog)
 
-    def start(self):
-        try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(2)
+        if self.udp:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.bind((self.host, self.port))
 
-            import socket as sock
-            hostname = sock.gethostname()
+        if self.stats_port:
+            self.stats_endpoint = start_stats_endpoint(self.collect_stats, port=self.stats_port)
+            self.logger.info(f'Stats available on http://127.0.0.1:{self.stats_port}/stats')
 
-            try:
-                import subprocess
-                output = subprocess.check_output('ipconfig', shell=True).decode()
-                ipv4_addresses = []
-                for line in output.split('\n'):
-                    if 'IPv4 Address' in line:
-                        ipv4_address = line.split(':')[-1].strip()
-                        ipv4_addresses.append(ipv4_address)
-                if ipv4_addresses:
-                    self.logger.info(f'Available IP addersses for client connections:')
-                    for ip in ipv4_addresses:
-                        self.logger.info(f' -{ip}')
-                else:
-                    self.logger.info(f'No IPv4 addresses found, clients may not be able to connect')
-            except Exception as e:
-                self.logger.error(f'Failed to get IPP addresses: {e}')
-                self.logger.info(f'Local hostname: {hostname}')
+        import socket as sock
+        hostname = sock.gethostname()
+
+        try:
+            import subprocess
+            output = subprocess.check_output('ipconfig', shell=True).decode()
+            ipv4_addresses = []
+            for line in output.split('\n'):
+                if 'IPv4 Address' in line:
+                    ipv4_address = line.split(':')[-1].strip()
+                    ipv4_addresses.append(ipv4_address)
+            if ipv4_addresses:
+                self.logger.info(f'Available IP addersses for client connections:')
+                for ip in ipv4_addresses:
+                    self.logger.info(f' -{ip}')
+            else:
+                self.logger.info(f'No IPv4 addresses found, clients may not be able to connect')
+        except Exception as e:
+            self.logger.error(f'Failed to get IPP addresses: {e}')
+            self.logger.info(f'Local hostname: {hostname}')
 
 
-            self.logger.info(f'Server started, listening on {self.host}:{self.port}')
-            self.logger.info(f'make sure port {self.port} is allowed through your firewall')
+        self.logger.info(f'Server started, listening on {self.host}:{self.port}')
+        self.logger.info(f'make sure port {self.port} is allowed through your firewall')
+
+    def start(self):
+        try:
+            self.open_listener(backlog=128)
 
             update_thread = threading.Thread(target=self.update_game_state)
             update_thread.daemon = True
             update_thread.start()
 
+            if self.udp_socket:
+                datagram_thread = threading.Thread(target=self.receive_datagrams)
+                datagram_thread.daemon = True
+                datagram_thread.start()
+
             while True:
                 client_socket, address = self.server_socket.accept()
-                if len(self.clients)>= 2:
-                    self.logger.info(f'Rejected connection from {address} - server full')
-                    client_socket.send(pickle.dumps({'status': "error", "message": "Server full"}))
-                    client_socket.close()
+                connection = QueuedConnection(client_socket)
+                assignment = self.add_client(connection, address)
+                if assignment is None:
                     continue
-                self.logger.info(f'Connection from {address} has been established')
-
-                player_num = len(self.clients) + 1
-                self.clients[player_num] = client_socket
-
-                # self.game_state[player_num]= client_socket
-                self.game_state['players'][player_num] = {
-                    'connected': True,
-                    'character': None,
-                    'x': 300 if player_num == 1 else 700,
-                    'y': 580,
-                    'health': 100,
-                    'is_dead': False,
-                    'is_attacking': False,
-                    'is_special_attacking': False,
-                    'facing_right': True if player_num == 2 else False
-                }
-
-                client_socket.send(pickle.dumps({'status':'connected', 'player_num': player_num}))
-                client_thread = threading.Thread(target=self.handle_client, args=(client_socket, player_num))
+
+                room, player_num = assignment
+                client_thread = threading.Thread(target=self.handle_client, args=(connection, room, player_num))
                 client_thread.daemon = True
                 client_thread.start()
 
@@ -103,253 +135,290 @@ class GameServer:
         finally:
             self.close_server()
 
-    def handle_client(self, client_socket, player_num):
-        buffer_size = 8192
-
-        heartbeat_thread = threading.Thread(target=self.send_heartbeats, args=(client_socket, player_num))
-        heartbeat_thread.daemon = True
-        heartbeat_thread.start()
-
-        try:
-            while True:
-                data = client_socket.recv(buffer_size)
-                if not data:
-                    break
-                try:
-                    client_data = pickle.loads(data)
-
-                    if 'player_action' in client_data:
-                        action = client_data['player_action']
-                        self.process_action(player_num, action)
+    def add_client(self, connection, address):
+        with self.rooms_lock:
+            if self.waiting_rooms:
+                room = next(iter(self.waiting_rooms.values()))
+            elif len(self.rooms) < self.max_rooms:
+                room = self.create_room(self.next_room_id)
+                self.rooms[room.room_id] = room
+                self.next_room_id += 1
+                self.logger.info(f'Opened room {room.room_id} ({len(self.rooms)} rooms)')
+            else:
+                self.logger.info(f'Rejected connection from {address} - server full')
+                connection.send({'status': "error", "message": "Server full"})
+                connection.close()
+                return None
+
+            with room.lock:
+                player_num = room.add_client(connection)
+                if room.is_full():
+                    self.waiting_rooms.pop(room.room_id, None)
+                else:
+                    self.waiting_rooms[room.room_id] = room
 
-                        if 'attack' in action and action['attack']:
-                            self.handle_attack(player_num, action)
+        self.logger.info(f'Connection from {address} has been established in room {room.room_id}')
+        if self.udp_socket:
+            self.offer_datagrams(connection, room, player_num)
+        return room, player_num
 
-                    elif 'character_select' in client_data:
-                        self.game_state['players'][player_num]['character']= client_data['character_select']
-                        self.logger.info(f'Player {player_num} selected character: {client_data['character_select']}')
+    def offer_datagrams(self, connection, room, player_num):
+        token = secrets.randbits(32) or 1
+        with self.rooms_lock:
+            self.datagram_clients[token] = (room, player_num, connection)
+        connection.datagram_token = token
+        connection.send({'status': 'udp_offer', 'port': self.port, 'token': token})
 
-                    elif 'ready' in client_data and client_data['ready']:
-                        self.game_state['ready'] += 1
-                        self.logger.info(f"Player {player_num} is ready. Ready count: {self.game_state['ready']}")
+    def receive_datagrams(self):
+        while True:
+            try:
+                data, address = self.udp_socket.recvfrom(MAX_DATAGRAM_SIZE)
+            except OSError:
+                break
+            self.handle_datagram(data, address)
 
-                    elif 'player_died' in client_data and client_data['player_died']:
-                        self.game_state['players'][player_num]['is_dead'] = True
-                        self.logger.info(f'Player {player_num} died!')
+    def handle_datagram(self, data, address):
+        # One socket carries the datagrams of every client, an error in one must not stop the others
+        try:
+            self.dispatch_datagram(data, address)
+        except Exception as e:
+            self.metrics.count('datagram_errors')
+            self.datagram_errors.error('Error handling datagram from %s: %s', address, e)
 
-                except pickle.UnpicklingError:
-                    self.logger.info(f'Error unpickling data from player {player_num}')
-                    continue
+    def dispatch_datagram(self, data, address):
+        try:
+            token, kind, payload = decode_datagram(data)
+        except ProtocolError:
+            self.metrics.count('bad_datagrams')
+            return
+        if kind == KIND_SNAPSHOT:
+            return
 
-                if 'reset_game' in client_data and client_data['reset_game']:
-                    self.reset_game()
-                    self.logger.info(f"Game reset requested by player {player_num}")
+        client = self.datagram_clients.get(token)
+        if client is None:
+            self.metrics.count('unknown_datagrams')
+            return
+        room, player_num, connection = client
+
+        if connection.datagram is None:
+            connection.datagram = DatagramChannel(self.send_datagram, address, token)
+            connection.send({'status': 'udp_ready'})
+            self.logger.info(f'Player {player_num} in room {room.room_id} switched to UDP from {address}')
+        elif connection.datagram.address != address:
+            connection.datagram.address = address
+        connection.datagram.bytes_received += len(data)
+
+        message = connection.decode_datagram(kind, payload)
+        if message is None:
+            return
+        with room.lock:
+            # The token is dropped before the player leaves, but a datagram looked up just before that can still get here
+            if room.clients.get(player_num) is not connection:
+                self.metrics.count('unknown_datagrams')
+                return
+            room.handle_message(player_num, message)
+        self.update_room_activity(room)
+
+    def send_datagram(self, data, address):
+        self.udp_socket.sendto(data, address)
+
+    def create_room(self, room_id):
+        recorder = None
+        if self.record_dir:
+            path = os.path.join(self.record_dir, f'room_{room_id}_{time.strftime("%Y%m%d_%H%M%S")}.replay')
+            recorder = ReplayRecorder(path, 1 / self.tick_rate, 1 / self.broadcast_rate)
+        return Room(room_id, self.logger, tick_interval=1 / self.tick_rate, broadcast_interval=1 / self.broadcast_rate,
+                    metrics=self.metrics, recorder=recorder)
+
+    def handle_client(self, connection, room, player_num):
+        try:
+            while True:
+                messages = connection.receive()
+                if messages is None:
+                    break
+                with room.lock:
+                    for client_data in messages:
+                        room.handle_message(player_num, client_data)
+                self.update_room_activity(room)
 
+        except ProtocolError as e:
+            self.logger.info(f'Protocol error from player {player_num}: {str(e)}')
         except Exception as e:
             self.logger.info(f'Error handling client {player_num}:{str(e)}')
             try:
                 error_msg = {'status': 'server_error', 'message': f'Server error: {str(e)}'}
-                client_socket.send(pickle.dumps(error_msg))
+                connection.send(error_msg)
             except:
                 pass
         finally:
-            self.handle_disconnect(player_num)
-
-    def send_heartbeats(self, client_socket, player_num):
-        while player_num in self.clients:
-            try:
-                client_socket.send(pickle.dumps({'status': 'heartbeat'}))
-                time.sleep(1)
-            except Exception as e:
-                self.logger.info(f'Heartbeat failed for player{player_num}: {str(e)}')
-                break
-
-    def handle_attack(self, attacker_num, action):
-        if not self.match_started:
-            return
-
-        attacker = self.game_state['players'][attacker_num]
-        defender_num = 1 if attacker_num == 2 else 2
-
-        if defender_num in self.game_state['players']:
-            defender = self.game_state['players'][defender_num]
-
-            distance = abs(attacker['x'] - defender['x'])
-            if distance <= action.get('attack_range', 100):
-                damage = action.get('damage', 10)
-                defender['health'] = max(0, defender['health'] - damage)
-
-                if defender['health'] <= 0:
-                    defender['is_dead'] = True
-                    self.logger.info(f'Player {defender_num} defeated!')
-
-    def process_action(self, player_num, action):
-        player = self.game_state['players'][player_num]
-
-        if 'x' in action:
-            player['x'] = action['x']
-        if 'y' in action:
-            player['y'] = action['y']
-
-        if 'facing_right' in action:
-            player['facing_right'] = action['facing_right']
-        if 'is_attacking' in action:
-            player['is_attacking'] = action['is_attacking']
-        if 'is_special_attacking' in action:
-            player['is_special_attacking'] = action['is_special_attacking']
-
-    def broadcast_game_state(self):
-        for player_num, client_socket in self.clients.items():
-            try:
-                player_specific_state = self.game_state.copy()
-                player_specific_state['timestamp'] = time.time()
-                client_socket.send(pickle.dumps(player_specific_state))
-            except Exception as e:
-                self.logger.error(f'Error sending game state: {str(e)}')
-
-
-    def handle_disconnect(self, player_num):
-        self.logger.info(f'Player {player_num} disconnected')
-        if player_num in self.clients:
-            try:
-                self.clients[player_num].send(pickle.dumps({
-                    'status': 'server_error',
-                    'message': 'Server disconnection occurred'
-                }))
-                self.clients[player_num].close()
-            except Exception:
-                pass
-            del self.clients[player_num]
-
-        if player_num in self.game_state['players']:
-            self.game_state['players'][player_num]['connected'] = False
-
-        other_player = 1 if player_num == 2 else 2
-        if other_player in self.clients:
-            try:
-                self.clients[other_player].send(pickle.dumps({
-                    'status': 'server_error',
-                    'message': f'Player {player_num} disconnected'
-                }))
-            except Exception:
-                pass
-
-        if self.match_started:
-            self.match_started = False
-            self.game_state['ready'] = 0
-            self.logger.info('Match ended due to player disconnect')
+            self.handle_disconnect(room, player_num)
+
+    def handle_message(self, room, player_num, client_data):
+        with room.lock:
+            room.handle_message(player_num, client_data)
+        self.update_room_activity(room)
+
+    def update_room_activity(self, room):
+        if room.needs_tick() and room.room_id not in self.active_rooms:
+            with self.rooms_lock:
+                self.active_rooms[room.room_id] = room
+
+    def handle_disconnect(self, room, player_num):
+        # The room lock is released before rooms_lock is taken, add_client takes them the other way round
+        with room.lock:
+            connection = room.clients.get(player_num)
+        # New datagrams stop finding the player before the room forgets about it
+        if connection is not None and connection.datagram_token is not None:
+            with self.rooms_lock:
+                self.datagram_clients.pop(connection.datagram_token, None)
+        with room.lock:
+            room.handle_disconnect(player_num)
+
+        if connection is not None:
+            # The server totals keep what closed connections sent and received
+            for name, value in connection_counters(connection).items():
+                self.metrics.count(name, value)
+
+        with self.rooms_lock:
+            if room.is_empty():
+                self.rooms.pop(room.room_id, None)
+                self.waiting_rooms.pop(room.room_id, None)
+                self.active_rooms.pop(room.room_id, None)
+                # The tick thread may still hold this room from its last list, the lock keeps it off the closed replay
+                with room.lock:
+                    room.close()
+                self.logger.info(f'Closed room {room.room_id} ({len(self.rooms)} rooms)')
+            elif room.room_id in self.rooms:
+                self.waiting_rooms[room.room_id] = room
+
+    def send_heartbeat_to_all(self, current_time):
+        with self.rooms_lock:
+            rooms = list(self.rooms.values())
+        for room in rooms:
+            with room.lock:
+                room.send_heartbeats(current_time, self.heartbeat_interval)
 
     def update_game_state(self):
-        last_broadcast_time = time.time()
-        broadcast_interval = 0.016
-        game_over_state = False
-        game_over_time = 0
-
+        next_heartbeat = time.time()
         while True:
+            steps = self.clock.due_steps(time.perf_counter())
             current_time = time.time()
-
-            if not self.match_started and self.game_state['ready'] >= 2:
-                self.logger.info('Both players ready, starting match!')
-                self.match_started = True
-
-                for client_socket in self.clients.values():
-                    client_socket.send(pickle.dumps({
-                        "status": "match_start",
-                        "game_state": self.game_state
-                    }))
-
-            if self.match_started:
-                if current_time - last_broadcast_time >= broadcast_interval:
-                    self.broadcast_game_state()
-                    last_broadcast_time = current_time
-
-                game_over = False
-                winner = None
-
-                for player_num, player_data in self.game_state['players'].items():
-                    if player_data['is_dead']:
-                        game_over = True
-                        winner = 1 if player_num == 2 else 2
-                        break
-
-                if game_over:
-                    game_over_state = True
-                    game_over_time = current_time
-                    self.logger.info(f'Game_over! Player {winner} wins!')
-                    for i in range(3):
-                        for client_socket in self.clients.values():
-                            try:
-                                client_socket.send(pickle.dumps({
-                                    "status": 'game_over',
-                                    'winner': winner,
-                                    'game_state': self.game_state
-                                }))
-                            except Exception as e:
-                                self.logger.error(f'Error sending game_over: {e}')
-                    time.sleep(0.1)
-
-            if game_over_state and current_time - game_over_time >= 5:
-                if self.match_started:
-                    self.match_started = False
-                    self.game_state['ready'] = 0
-                    game_over_state = False
-
-                for player_num, player in self.game_state['players'].items():
-                    player.update({
-                        'health': 100,
-                        'is_dead': False,
-                        'x': 300 if player_num == 1 else 700,
-                        'y': 580
-                    })
-                self.logger.info('Game reset for new match')
-
-            time.sleep(0.01)
-
-    def reset_game(self):
-        self.match_started = False
-        self.game_state['ready'] = 0
-
-        for player_num, player in self.game_state['players'].items():
-            connected_status = player.get('connected', True)
-            character = None
-
-            self.game_state['players'][player_num] = {
-                'connected': connected_status,
-                'character': character,
-                'x': 300 if player_num == 1 else 700,
-                'y': 580,
-                'health': 100,
-                'is_dead': False,
-                'is_attacking': False,
-                'is_special_attacking': False,
-                'facing_right': True if player_num == 2 else False,
-                'velocity_y': 0,
-                'is_jumping': False
-            }
-        for _ in range(3):
-            for client_socket in self.clients.values():
-                try:
-                    client_socket.send(pickle.dumps({
-                        'status': 'game_reset',
-                        "game_state": self.game_state
-                    }))
-                except Exception as e:
-                    self.logger.error(f'Error sending game reset: {e}')
-            time.sleep(0.05)
-
-        self.logger.info("Game fully reset - returning to character selection")
+            if steps:
+                self.tick(current_time, steps)
+
+            if current_time >= next_heartbeat:
+                self.send_heartbeat_to_all(current_time)
+                next_heartbeat = current_time + self.heartbeat_interval
+
+            time.sleep(self.clock.time_until_next(time.perf_counter()))
+
+    def tick(self, current_time, steps=1):
+        start = time.perf_counter()
+        with self.rooms_lock:
+            rooms = list(self.active_rooms.values())
+
+        if self.physics is not None:
+            self.tick_batched(rooms, current_time, steps)
+        else:
+            for room in rooms:
+                with room.lock:
+                    room.tick(current_time, steps)
+
+        for room in rooms:
+            with room.lock:
+                idle = not room.needs_tick()
+            if idle:
+                with self.rooms_lock:
+                    if not room.needs_tick():
+                        self.active_rooms.pop(room.room_id, None)
+        duration = time.perf_counter() - start
+        self.metrics.observe('tick', duration)
+        self.tick_telemetry.record('tick', steps, len(rooms), duration)
+        if duration > self.clock.interval:
+            self.metrics.count('tick_overruns')
+            self.overrun_telemetry.info('Tick took %.1f ms for %d rooms, the budget is %.1f ms',
+                                        duration * 1000, len(rooms), self.clock.interval * 1000)
+
+    def tick_batched(self, rooms, current_time, steps):
+        # Every room lock is held for the whole batch, taken in room id order. Client threads only ever
+        # hold one room lock at a time, so this can not deadlock with them.
+        with ExitStack() as locks:
+            for room in sorted(rooms, key=lambda room: room.room_id):
+                locks.enter_context(room.lock)
+
+            for room in rooms:
+                room.start_match_if_ready()
+            playing = [room for room in rooms if room.match_started]
+
+            for _ in range(steps):
+                room_movers = [(room, room.prepare_step()) for room in playing]
+                self.physics.step_players([(player, inputs, room.platform_index)
+                                           for room, movers in room_movers
+                                           for player_num, player, inputs in movers], self.clock.interval)
+                for room, movers in room_movers:
+                    room.check_deaths(movers)
+
+            for room in rooms:
+                room.finish_tick(current_time)
+                room.record_tick(current_time, steps)
+
+    def collect_stats(self):
+        """The metrics snapshot plus room counts and the counters of every connected client."""
+        with self.rooms_lock:
+            rooms = list(self.rooms.values())
+            active_rooms = len(self.active_rooms)
+
+        stats = self.metrics.snapshot()
+        totals = stats['counters']
+        clients = []
+        for room in rooms:
+            with room.lock:
+                for player_num, connection in room.clients.items():
+                    client = connection_counters(connection)
+                    for name, value in client.items():
+                        totals[name] = totals.get(name, 0) + value
+                    rtt = room.rtt.get(player_num)
+                    client.update(room=room.room_id, player=player_num, udp=connection.datagram is not None,
+                                  rtt_ms=round(rtt.smoothed * 1000, 2) if rtt and rtt.samples else None)
+                    clients.append(client)
+
+        totals['dropped_ticks'] = self.clock.dropped_ticks
+        stats.update(rooms=len(rooms), active_rooms=active_rooms, clients=clients)
+        return stats
 
     def close_server(self):
         self.logger.info('Closing server')
-        for client_socket in self.clients.values():
-            try:
-                client_socket.close()
-            except Exception:
-                pass
+        if self.stats_endpoint:
+            self.stats_endpoint.shutdown()
+            self.stats_endpoint.server_close()
+        with self.rooms_lock:
+            for room in self.rooms.values():
+                with room.lock:
+                    room.close()
         self.server_socket.close()
+        if self.udp_socket:
+            self.udp_socket.close()
+
+def connection_counters(connection):
+    # TCP and UDP added up, frames are the messages of any kind
+    counters = {
+        'bytes_sent': connection.bytes_sent,
+        'bytes_received': connection.bytes_received,
+        'frames_sent': connection.frames_sent,
+        'frames_received': connection.frames_received,
+        'decode_errors': connection.decode_errors,
+        'superseded_snapshots': connection.superseded_snapshots
+    }
+    if connection.datagram is not None:
+        counters['bytes_sent'] += connection.datagram.bytes_sent
+        counters['bytes_received'] += connection.datagram.bytes_received
+        counters['frames_sent'] += connection.datagram.frames_sent
+    return counters
 
 if __name__ == "__main__":
-    server = GameServer()
+    server = GameServer(stats_port=5556)
+    telemetry.enable_sink()
+    install_dump_signal('telemetry_server.bin')
     try:
         server.start()
     except KeyboardInterrupt:
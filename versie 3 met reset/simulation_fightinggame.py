@@ -0,0 +1,169 @@
+import math
+from bisect import bisect_left, bisect_right
+
+# Movement values are per second so the tick rate can change without
+# changing how the game feels. They match the old client side physics,
+# which moved 5 px and added 0.8 gravity every 20 ms action.
+MOVE_SPEED = 250.0
+GRAVITY = 2000.0
+JUMP_SPEED = 900.0
+PLAYER_HALF_WIDTH = 50
+SCREEN_MIN_X = 50
+SCREEN_MAX_X = 950
+DEATH_DEPTH = 100
+SUPPORT_TOLERANCE = 0.5
+
+
+def overlaps(platform, x):
+    return (x + PLAYER_HALF_WIDTH > platform['x'] and
+            x - PLAYER_HALF_WIDTH < platform['x'] + platform['width'])
+
+
+class PlatformIndex:
+    # Platforms are bucketed in vertical columns of cell_size pixels and kept
+    # sorted by height inside a column, so a query only looks at the few
+    # platforms under the player's column around the requested height
+    # instead of every platform on the stage.
+    def __init__(self, platforms, cell_size=100):
+        self.platforms = list(platforms)
+        self.cell_size = cell_size
+        self.cells = {}
+        self.lowest_y = max((platform['y'] for platform in self.platforms), default=math.inf)
+        # Rooms with the same stage share this key, batched physics groups players by it
+        self.layout = tuple((platform['x'], platform['y'], platform['width']) for platform in self.platforms)
+
+        for platform in sorted(self.platforms, key=lambda platform: platform['y']):
+            # A player overlaps a platform while x is within PLAYER_HALF_WIDTH of either edge
+            first = self.cell(platform['x'] - PLAYER_HALF_WIDTH)
+            last = self.cell(platform['x'] + platform['width'] + PLAYER_HALF_WIDTH)
+            for column in range(first, last + 1):
+                platforms_in_cell, heights = self.cells.setdefault(column, ([], []))
+                platforms_in_cell.append(platform)
+                heights.append(platform['y'])
+
+    def cell(self, x):
+        return int(x // self.cell_size)
+
+    def between(self, x, top, bottom):
+        """Yields the platforms under x with top <= y <= bottom, highest first."""
+        column = self.cells.get(self.cell(x))
+        if column is None:
+            return
+        platforms, heights = column
+        for index in range(bisect_left(heights, top), bisect_right(heights, bottom)):
+            if overlaps(platforms[index], x):
+                yield platforms[index]
+
+    def support(self, x, y):
+        return next(self.between(x, y - SUPPORT_TOLERANCE, y + SUPPORT_TOLERANCE), None)
+
+    def landing(self, x, previous_y, y):
+        # Swept check so a fast fall can never pass through a thin platform
+        return next(self.between(x, previous_y, y), None)
+
+
+class PlayerState:
+    # One player's state as a fixed set of slots instead of a dict per player.
+    # The room, step_player and the snapshot codec use the attributes
+    # directly; as_dict gives the pickled form for control messages, and
+    # item access lets the client draw a predicted state like a received dict.
+    __slots__ = ('connected', 'character', 'x', 'y', 'health', 'velocity_y', 'is_dead', 'is_attacking',
+                 'is_special_attacking', 'facing_right', 'is_jumping', 'last_input')
+
+    def __init__(self, player_num, connected=True):
+        self.connected = connected
+        self.reset(player_num)
+
+    def reset(self, player_num):
+        self.character = None
+        self.velocity_y = 0
+        self.is_attacking = False
+        self.is_special_attacking = False
+        self.facing_right = player_num == 2
+        self.is_jumping = False
+        self.last_input = 0
+        self.respawn(player_num)
+
+    def respawn(self, player_num):
+        self.x = 300 if player_num == 1 else 700
+        self.y = 580
+        self.health = 100
+        self.is_dead = False
+
+    def update(self, values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __repr__(self):
+        return f'PlayerState({self.as_dict()})'
+
+
+def step_player(player, inputs, platform_index, dt):
+    move = inputs.get('move', 0)
+    if move:
+        player.x = max(SCREEN_MIN_X, min(SCREEN_MAX_X, player.x + move * MOVE_SPEED * dt))
+        player.facing_right = move > 0
+
+    support = platform_index.support(player.x, player.y)
+    if support is not None and inputs.get('jump'):
+        player.velocity_y = -JUMP_SPEED
+        player.is_jumping = True
+        support = None
+
+    if support is not None:
+        player.y = support['y']
+        player.velocity_y = 0
+        player.is_jumping = False
+        return
+
+    previous_y = player.y
+    player.velocity_y += GRAVITY * dt
+    player.y = previous_y + player.velocity_y * dt
+
+    if player.velocity_y > 0:
+        landing = platform_index.landing(player.x, previous_y, player.y)
+        if landing is not None:
+            player.y = landing['y']
+            player.velocity_y = 0
+            player.is_jumping = False
+
+
+class FixedTimestep:
+    def __init__(self, rate, max_catch_up=5):
+        self.interval = 1.0 / rate
+        self.max_catch_up = max_catch_up
+        self.next_tick = None
+        self.dropped_ticks = 0
+
+    def due_steps(self, now):
+        if self.next_tick is None:
+            self.next_tick = now
+
+        steps = 0
+        while now >= self.next_tick and steps < self.max_catch_up:
+            # Advancing by a fixed interval instead of from "now" keeps the schedule drift free
+            self.next_tick += self.interval
+            steps += 1
+
+        if now >= self.next_tick:
+            behind = int((now - self.next_tick) / self.interval) + 1
+            self.dropped_ticks += behind
+            self.next_tick += behind * self.interval
+        return steps
+
+    def time_until_next(self, now):
+        if self.next_tick is None:
+            return 0.0
+        return max(0.0, self.next_tick - now)
@@ -0,0 +1,159 @@
+import json
+import logging
+import signal
+import struct
+import threading
+import time
+
+# A binary record is the time, a channel id, an event id and up to four numbers
+RECORD = struct.Struct('!dHH4d')
+RECORD_VALUES = 4
+PADDING = (0.0,) * RECORD_VALUES
+DUMP_HEADER = struct.Struct('!I')
+
+
+class RingBufferSink:
+    # The most recent records in one preallocated bytearray. Writing only
+    # packs numbers, nothing is formatted until the buffer is dumped.
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.buffer = bytearray(RECORD.size * capacity)
+        self.written = 0
+        # Reentrant: the SIGUSR1 dump runs on the main thread, possibly in the middle of a write there
+        self.lock = threading.RLock()
+
+    def write(self, channel_id, event_id, values):
+        with self.lock:
+            offset = self.written % self.capacity * RECORD.size
+            RECORD.pack_into(self.buffer, offset, time.time(), channel_id, event_id,
+                             *values[:RECORD_VALUES], *PADDING[len(values):])
+            self.written += 1
+
+    def contents(self):
+        """Returns the stored records oldest first, as packed bytes."""
+        with self.lock:
+            if self.written <= self.capacity:
+                return bytes(self.buffer[:self.written * RECORD.size])
+            split = self.written % self.capacity * RECORD.size
+            return bytes(self.buffer[split:] + self.buffer[:split])
+
+
+class TelemetryChannel:
+    # One subsystem. The log calls take a %-style message and its arguments
+    # and return before formatting anything when the level is off, when the
+    # call falls outside the sample or when the rate limit is used up.
+    def __init__(self, telemetry, channel_id, name, logger, max_per_second=None, sample_every=1):
+        self.telemetry = telemetry
+        self.channel_id = channel_id
+        self.name = name
+        self.logger = logger
+        self.max_per_second = max_per_second
+        self.sample_every = sample_every
+        self.calls = 0
+        self.suppressed = 0
+        self.tokens = max_per_second or 0
+        self.last_refill = time.monotonic()
+
+    def allow(self):
+        self.calls += 1
+        if self.calls % self.sample_every:
+            self.suppressed += 1
+            return False
+        if self.max_per_second is not None:
+            now = time.monotonic()
+            self.tokens = min(self.max_per_second, self.tokens + (now - self.last_refill) * self.max_per_second)
+            self.last_refill = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1
+        return True
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level) or not self.allow():
+            return
+        if self.suppressed:
+            msg += ' (%d similar suppressed)'
+            args += (self.suppressed,)
+            self.suppressed = 0
+        self.logger.log(level, msg, *args)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def error(self, msg, *args):
+        self.log(logging.ERROR, msg, *args)
+
+    def record(self, event, *values):
+        """Writes up to four numbers to the ring buffer sink, when one is enabled."""
+        sink = self.telemetry.sink
+        if sink is not None:
+            sink.write(self.channel_id, self.telemetry.event_id(event), values)
+
+
+class Telemetry:
+    def __init__(self):
+        self.channels = {}
+        self.events = {}
+        self.sink = None
+        self.lock = threading.RLock()
+
+    def channel(self, name, logger=None, max_per_second=None, sample_every=1):
+        with self.lock:
+            channel = self.channels.get(name)
+            if channel is None:
+                channel = TelemetryChannel(self, len(self.channels), name, logger or logging.getLogger(name),
+                                           max_per_second, sample_every)
+                self.channels[name] = channel
+            return channel
+
+    def event_id(self, name):
+        event_id = self.events.get(name)
+        if event_id is None:
+            with self.lock:
+                event_id = self.events.setdefault(name, len(self.events))
+        return event_id
+
+    def enable_sink(self, capacity=8192):
+        if self.sink is None:
+            self.sink = RingBufferSink(capacity)
+        return self.sink
+
+    def dump(self, path):
+        """Writes the ring buffer and the names it refers to, returns the number of records written."""
+        if self.sink is None:
+            return 0
+        with self.lock:
+            names = json.dumps({'channels': list(self.channels), 'events': list(self.events)}).encode()
+        records = self.sink.contents()
+        with open(path, 'wb') as dump_file:
+            dump_file.write(DUMP_HEADER.pack(len(names)))
+            dump_file.write(names)
+            dump_file.write(records)
+        return len(records) // RECORD.size
+
+
+def read_dump(path):
+    """Returns (time, channel, event, values) for every record in a dump."""
+    with open(path, 'rb') as dump_file:
+        data = dump_file.read()
+    names_size = DUMP_HEADER.unpack_from(data, 0)[0]
+    names = json.loads(data[DUMP_HEADER.size:DUMP_HEADER.size + names_size])
+    records = []
+    for timestamp, channel_id, event_id, *values in RECORD.iter_unpack(data[DUMP_HEADER.size + names_size:]):
+        records.append((timestamp, names['channels'][channel_id], names['events'][event_id], values))
+    return records
+
+
+def install_dump_signal(path):
+    # kill -USR1 <pid> dumps the ring buffer of a running process, Windows has no such signal
+    if not hasattr(signal, 'SIGUSR1'):
+        return False
+    signal.signal(signal.SIGUSR1, lambda signum, frame: telemetry.dump(path))
+    return True
+
+
+telemetry = Telemetry()
@@ -0,0 +1,59 @@
+import unittest
+
+from codec_fightinggame import PLAYER_FIELDS, PLAYER_FLAGS, SnapshotEncoder, SnapshotDecoder
+from gamestate_fightinggame import GameStateBuffer
+from simulation_fightinggame import PlayerState
+
+
+class SnapshotRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.players = {1: PlayerState(1), 2: PlayerState(2)}
+        self.encoder = SnapshotEncoder()
+        self.decoder = SnapshotDecoder()
+        self.state = GameStateBuffer()
+        self.acked = None
+
+    def send(self, timestamp):
+        # The client side of one snapshot: decode it and merge it into the published state
+        self.encoder.capture(self.players, timestamp)
+        snapshot = self.decoder.decode(self.encoder.encode(self.acked))
+        return self.state.merge(players=snapshot['players'])
+
+    def test_first_snapshot_is_complete(self):
+        state = self.send(0.0)
+        self.assertEqual(set(state['players'][1]), set(PLAYER_FIELDS + PLAYER_FLAGS + ('last_input',)))
+        self.assertEqual(state['players'][2]['x'], 700)
+        self.assertTrue(state['players'][2]['facing_right'])
+
+    def test_field_reverting_while_ack_in_flight(self):
+        self.players[1].facing_right = False
+        self.send(0.0)
+        self.acked = self.encoder.sequence
+
+        # The client sees the change, its ack for that snapshot has not arrived yet
+        self.players[1].facing_right = True
+        self.players[1].x = 320
+        state = self.send(0.1)
+        self.assertTrue(state['players'][1]['facing_right'])
+        self.assertEqual(state['players'][1]['x'], 320)
+
+        # Back to the acked values, so this delta against the baseline is empty
+        self.players[1].facing_right = False
+        self.players[1].x = 300
+        state = self.send(0.2)
+        self.assertFalse(state['players'][1]['facing_right'])
+        self.assertEqual(state['players'][1]['x'], 300)
+
+    def test_player_unchanged_since_baseline(self):
+        self.send(0.0)
+        self.acked = self.encoder.sequence
+        self.players[2].health = 80
+        self.send(0.1)
+        self.players[2].health = 100
+        state = self.send(0.2)
+        self.assertEqual(state['players'][2]['health'], 100)
+        self.assertEqual(state['players'][1]['x'], 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,11 @@
 import pygame
 import socket
-import pickle
 import threading
 import sys
 import time
 import logging
 from pygame.locals import *
+from network_fightinggame import FramedConnection, ProtocolError
 
 class GameClient:
     def __init__(self, host='localhost', port=5555):
@@ -18,6 +18,7 @@ class GameClient:
         self.host = host
         self.port = port
         self.client_socket = None
+        self.connection = None
         self.player_num = None
         self.character_name = None
         self.opponent_character = None
@@ -72,8 +73,10 @@ class GameClient:
             self.client_socket.connect((self.host, self.port))
             self.client_socket.settimeout(None)
 
-            data = self.client_socket.recv(4096)
-            response = pickle.loads(data)
+            self.connection = FramedConnection(self.client_socket)
+            response = self.connection.next_message()
+            if response is None:
+                raise ConnectionError('Server closed the connection')
 
             if response['status'] == 'connected':
                 self.player_num = response['player_num']
@@ -129,13 +132,11 @@ class GameClient:
             time.sleep(1)
 
     def receive_data(self):
-        buffer_size = 8192
-
         while self.connected:
             try:
-                data = self.client_socket.recv(buffer_size)
+                messages = self.connection.receive()
 
-                if not data:
+                if messages is None:
                     self.logger.info("Empty data received from server - disconnected")
                     self.server_error = True
                     self.error_message = "Server disconnected"
@@ -144,61 +145,15 @@ class GameClient:
 
                 self.last_server_response = time.time()
 
-                try:
-                    response = pickle.loads(data)
-
-                    if 'status' in response:
-                        if response['status'] == 'match_start':
-                            self.match_started = True
-                            self.game_state = response['game_state']
-                            self.init_platforms()
-                        elif response['status'] == 'game_over':
-                            self.logger.info(f'Game over received with winner: {response.get('winner')}')
-                            self.game_over = True
-                            self.winner = response.get('winner')
-                            if 'game_state' in response:
-                                self.game_state = response['game_state']
-                        elif response['status'] == 'server_error':
-                            self.server_error = True
-                            self.error_message = response.get('message', "Server reported an error")
-                            self.logger.info(f'Server error: {self.error_message}')
-                        elif response['status'] == 'heartbeat':
-                            continue
-                    else:
-                        if 'players' in response:
-                            for player_num, player_data in response['players'].items():
-                                if player_num in self.game_state.get('players', {}):
-                                    self.game_state['players'][player_num].update(player_data)
-                                else:
-                                    if 'players' not in self.game_state:
-                                        self.game_state['players'] = {}
-                                    self.game_state['players'][player_num] = player_data
-
-                        if 'platforms' in response and response['platforms'] != self.game_state.get('platforms'):
-                            self.game_state['platforms'] = response['platforms']
-                            self.init_platforms()
-
-                    players = self.game_state.get('players', {})
-                    if isinstance(players, dict):
-                        for player_num, player_data in players.items():
-                            if isinstance(player_data, dict) and player_data.get('is_dead', False):
-                                opponent_num = 1 if int(player_num) == 2 else 2
-                                if not self.game_over:
-                                    self.game_over = True
-                                    self.winner = opponent_num
-                                    self.logger.info(f'Detected game over state! Winner: {self.winner}')
-
-                    opponent_num = 2 if self.player_num == 1 else 1
-                    if (isinstance(self.game_state.get('players', {}), dict) and
-                            opponent_num in self.game_state['players'] and
-                            self.game_state['players'][opponent_num].get('character') and
-                            not self.opponent_character):
-                        self.opponent_character = self.game_state['players'][opponent_num]['character']
-                        self.opponent_sprite = self.create_character_sprite(self.opponent_character)
-
-                except pickle.UnpicklingError as e:
-                    self.logger.info(f'Error unpickling data: {str(e)}')
-                    continue
+                for response in messages:
+                    self.handle_server_message(response)
+
+            except ProtocolError as e:
+                self.logger.info(f'Protocol error from server: {str(e)}')
+                self.server_error = True
+                self.error_message = f'Invalid data from server: {str(e)}'
+                self.connected = False
+                break
 
             except (socket.error, ConnectionResetError, ConnectionAbortedError) as e:
                 self.logger.info(f'socket connection error: {str(e)}')
@@ -214,10 +169,61 @@ class GameClient:
                 self.connected = False
                 break
 
+    def handle_server_message(self, response):
+        if 'status' in response:
+            if response['status'] == 'match_start':
+                self.match_started = True
+                self.game_state = response['game_state']
+                self.init_platforms()
+            elif response['status'] == 'game_over':
+                self.logger.info(f'Game over received with winner: {response.get('winner')}')
+                self.game_over = True
+                self.winner = response.get('winner')
+                if 'game_state' in response:
+                    self.game_state = response['game_state']
+            elif response['status'] == 'server_error':
+                self.server_error = True
+                self.error_message = response.get('message', "Server reported an error")
+                self.logger.info(f'Server error: {self.error_message}')
+            elif response['status'] == 'heartbeat':
+                return
+
+        else:
+            if 'players' in response:
+                for player_num, player_data in response['players'].items():
+                    if player_num in self.game_state.get('players', {}):
+                        self.game_state['players'][player_num].update(player_data)
+                    else:
+                        if 'players' not in self.game_state:
+                            self.game_state['players'] = {}
+                        self.game_state['players'][player_num] = player_data
+
+            if 'platforms' in response and response['platforms'] != self.game_state.get('platforms'):
+                self.game_state['platforms'] = response['platforms']
+                self.init_platforms()
+
+        players = self.game_state.get('players', {})
+        if isinstance(players, dict):
+            for player_num, player_data in players.items():
+                if isinstance(player_data, dict) and player_data.get('is_dead', False):
+                    opponent_num = 1 if int(player_num) == 2 else 2
+                    if not self.game_over:
+                        self.game_over = True
+                        self.winner = opponent_num
+                        self.logger.info(f'Detected game over state! Winner: {self.winner}')
+
+        opponent_num = 2 if self.player_num == 1 else 1
+        if (isinstance(self.game_state.get('players', {}), dict) and
+                opponent_num in self.game_state['players'] and
+                self.game_state['players'][opponent_num].get('character') and
+                not self.opponent_character):
+            self.opponent_character = self.game_state['players'][opponent_num]['character']
+            self.opponent_sprite = self.create_character_sprite(self.opponent_character)
+
     def send_data(self, data):
         try:
-            if self.client_socket and self.connected:
-                self.client_socket.send(pickle.dumps(data))
+            if self.connection and self.connected:
+                self.connection.send(data)
         except Exception as e:
             self.logger.info(f'Error sending data: {str(e)}')
             self.server_error = True
@@ -722,8 +728,8 @@ class GameClient:
             self.wait_for_match()
             self.run_game()
 
-            if self.client_socket:
-                self.client_socket.close()
+            if self.connection:
+                self.connection.close()
         else:
             self.logger.info('Failed to connect to server')
             self.server_error = True
@@ -0,0 +1,147 @@
+import pickle
+import struct
+import threading
+import logging
+
+# Every message on the wire is one frame: a 4 byte payload length, a 1 byte
+# payload kind and then the payload itself.
+HEADER = struct.Struct('!IB')
+KIND_PICKLE = 0
+
+MAX_FRAME_SIZE = 1024 * 1024
+DEFAULT_BUFFER_SIZE = 64 * 1024
+
+logger = logging.getLogger('GameNetwork')
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(payload, kind=KIND_PICKLE):
+    return HEADER.pack(len(payload), kind) + payload
+
+
+def encode_message(message):
+    return encode_frame(pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def decode_payload(kind, payload):
+    if kind == KIND_PICKLE:
+        return pickle.loads(payload)
+    raise ProtocolError(f'Unknown frame kind {kind}')
+
+
+class FramedConnection:
+    def __init__(self, sock, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.sock = sock
+        self.send_lock = threading.Lock()
+
+        # One receive buffer per connection, reused for every recv_into call.
+        # start/end mark the bytes that have been received but not decoded yet.
+        self.buffer_size = buffer_size
+        self.buffer = bytearray(buffer_size)
+        self.start = 0
+        self.end = 0
+        self.decode_errors = 0
+
+    def send(self, message):
+        self.send_frame(encode_message(message))
+
+    def send_frame(self, frame):
+        with self.send_lock:
+            self.sock.sendall(frame)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _reserve(self, needed):
+        if len(self.buffer) - self.end >= needed:
+            return
+        pending = self.end - self.start
+        if self.start:
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, pending
+        if len(self.buffer) - self.end < needed:
+            self.buffer.extend(bytes(needed - (len(self.buffer) - self.end)))
+
+    def _fill(self):
+        self._reserve(HEADER.size)
+        received = self.sock.recv_into(memoryview(self.buffer)[self.end:])
+        if not received:
+            return False
+        self.end += received
+        return True
+
+    def _next_frame(self):
+        if self.end - self.start < HEADER.size:
+            return None
+        length, kind = HEADER.unpack_from(self.buffer, self.start)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f'Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit')
+
+        frame_end = self.start + HEADER.size + length
+        if frame_end > self.end:
+            # Only the bytes of this frame that have not arrived yet, the part already received is kept
+            self._reserve(frame_end - self.end)
+            return None
+
+        payload_start = self.start + HEADER.size
+        self.start = frame_end
+        if self.start == self.end:
+            self.start = self.end = 0
+        return kind, payload_start, frame_end
+
+    def _decode_next(self):
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return None
+            kind, payload_start, payload_end = frame
+            message = None
+            with memoryview(self.buffer) as view:
+                try:
+                    message = decode_payload(kind, view[payload_start:payload_end])
+                except (pickle.UnpicklingError, ProtocolError, EOFError, ValueError) as e:
+                    self.decode_errors += 1
+                    logger.info('Dropped undecodable frame: %s', e)
+            self._shrink()
+            if message is not None:
+                return message
+
+    def _shrink(self):
+        # A large frame grows the buffer, once it is decoded and nothing is pending it goes back to its normal size
+        if self.start == self.end and len(self.buffer) > self.buffer_size:
+            self.buffer = bytearray(self.buffer_size)
+            self.start = self.end = 0
+
+    def drain(self):
+        messages = []
+        while True:
+            message = self._decode_next()
+            if message is None:
+                return messages
+            messages.append(message)
+
+    def receive(self):
+        """Returns every complete message after at most one recv, or None when the peer closed."""
+        messages = self.drain()
+        if messages:
+            return messages
+        if not self._fill():
+            return None
+        return self.drain()
+
+    def next_message(self):
+        while True:
+            message = self._decode_next()
+            if message is not None:
+                return message
+            if not self._fill():
+                return None
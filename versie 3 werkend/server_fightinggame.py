@@ -1,9 +1,10 @@
 import socket
-import pickle
 import threading
 import time
 import logging
 
+from network_fightinggame import FramedConnection, ProtocolError
+
 class GameServer:
     def __init__(self, host='0.0.0.0', port=5555):
         logging.basicConfig(level=logging.INFO,
@@ -70,15 +71,16 @@ class GameServer:
 
             while True:
                 client_socket, address = self.server_socket.accept()
+                connection = FramedConnection(client_socket)
                 if len(self.clients)>= 2:
                     self.logger.info(f'Rejected connection from {address} - server full')
-                    client_socket.send(pickle.dumps({'status': "error", "message": "Server full"}))
-                    client_socket.close()
+                    connection.send({'status': "error", "message": "Server full"})
+                    connection.close()
                     continue
                 self.logger.info(f'Connection from {address} has been established')
 
                 player_num = len(self.clients) + 1
-                self.clients[player_num] = client_socket
+                self.clients[player_num] = connection
 
                 # self.game_state[player_num]= client_socket
                 self.game_state['players'][player_num] = {
@@ -93,8 +95,8 @@ class GameServer:
                     'facing_right': True if player_num == 2 else False
                 }
 
-                client_socket.send(pickle.dumps({'status':'connected', 'player_num': player_num}))
-                client_thread = threading.Thread(target=self.handle_client, args=(client_socket, player_num))
+                connection.send({'status':'connected', 'player_num': player_num})
+                client_thread = threading.Thread(target=self.handle_client, args=(connection, player_num))
                 client_thread.daemon = True
                 client_thread.start()
 
@@ -103,58 +105,55 @@ class GameServer:
         finally:
             self.close_server()
 
-    def handle_client(self, client_socket, player_num):
-        buffer_size = 8192
-
-        heartbeat_thread = threading.Thread(target=self.send_heartbeats, args=(client_socket, player_num))
+    def handle_client(self, connection, player_num):
+        heartbeat_thread = threading.Thread(target=self.send_heartbeats, args=(connection, player_num))
         heartbeat_thread.daemon = True
         heartbeat_thread.start()
 
         try:
             while True:
-                data = client_socket.recv(buffer_size)
-                if not data:
+                messages = connection.receive()
+                if messages is None:
                     break
-                try:
-                    client_data = pickle.loads(data)
-
-                    if 'player_action' in client_data:
-                        action = client_data['player_action']
-                        self.process_action(player_num, action)
-
-                        if 'attack' in action and action['attack']:
-                            self.handle_attack(player_num, action)
-
-                    elif 'character_select' in client_data:
-                        self.game_state['players'][player_num]['character']= client_data['character_select']
-                        self.logger.info(f'Player {player_num} selected character: {client_data['character_select']}')
-
-                    elif 'ready' in client_data and client_data['ready']:
-                        self.game_state['ready'] += 1
-                        self.logger.info(f"Player {player_num} is ready. Ready count: {self.game_state['ready']}")
-
-                    elif 'player_died' in client_data and client_data['player_died']:
-                        self.game_state['players'][player_num]['is_dead'] = True
-                        self.logger.info(f'Player {player_num} died!')
-
-                except pickle.UnpicklingError:
-                    self.logger.info(f'Error unpickling data from player {player_num}')
-                    continue
+                for client_data in messages:
+                    self.handle_message(player_num, client_data)
 
+        except ProtocolError as e:
+            self.logger.info(f'Protocol error from player {player_num}: {str(e)}')
         except Exception as e:
             self.logger.info(f'Error handling client {player_num}:{str(e)}')
             try:
                 error_msg = {'status': 'server_error', 'message': f'Server error: {str(e)}'}
-                client_socket.send(pickle.dumps(error_msg))
+                connection.send(error_msg)
             except:
                 pass
         finally:
             self.handle_disconnect(player_num)
 
-    def send_heartbeats(self, client_socket, player_num):
+    def handle_message(self, player_num, client_data):
+        if 'player_action' in client_data:
+            action = client_data['player_action']
+            self.process_action(player_num, action)
+
+            if 'attack' in action and action['attack']:
+                self.handle_attack(player_num, action)
+
+        elif 'character_select' in client_data:
+            self.game_state['players'][player_num]['character']= client_data['character_select']
+            self.logger.info(f'Player {player_num} selected character: {client_data['character_select']}')
+
+        elif 'ready' in client_data and client_data['ready']:
+            self.game_state['ready'] += 1
+            self.logger.info(f"Player {player_num} is ready. Ready count: {self.game_state['ready']}")
+
+        elif 'player_died' in client_data and client_data['player_died']:
+            self.game_state['players'][player_num]['is_dead'] = True
+            self.logger.info(f'Player {player_num} died!')
+
+    def send_heartbeats(self, connection, player_num):
         while player_num in self.clients:
             try:
-                client_socket.send(pickle.dumps({'status': 'heartbeat'}))
+                connection.send({'status': 'heartbeat'})
                 time.sleep(1)
             except Exception as e:
                 self.logger.info(f'Heartbeat failed for player{player_num}: {str(e)}')
@@ -195,11 +194,11 @@ class GameServer:
             player['is_special_attacking'] = action['is_special_attacking']
 
     def broadcast_game_state(self):
-        for player_num, client_socket in self.clients.items():
+        for player_num, connection in self.clients.items():
             try:
                 player_specific_state = self.game_state.copy()
                 player_specific_state['timestamp'] = time.time()
-                client_socket.send(pickle.dumps(player_specific_state))
+                connection.send(player_specific_state)
             except Exception as e:
                 self.logger.error(f'Error sending game state: {str(e)}')
 
@@ -208,10 +207,10 @@ class GameServer:
         self.logger.info(f'Player {player_num} disconnected')
         if player_num in self.clients:
             try:
-                self.clients[player_num].send(pickle.dumps({
+                self.clients[player_num].send({
                     'status': 'server_error',
                     'message': 'Server disconnection occurred'
-                }))
+                })
                 self.clients[player_num].close()
             except Exception:
                 pass
@@ -223,10 +222,10 @@ class GameServer:
         other_player = 1 if player_num == 2 else 2
         if other_player in self.clients:
             try:
-                self.clients[other_player].send(pickle.dumps({
+                self.clients[other_player].send({
                     'status': 'server_error',
                     'message': f'Player {player_num} disconnected'
-                }))
+                })
             except Exception:
                 pass
 
@@ -248,11 +247,11 @@ class GameServer:
                 self.logger.info('Both players ready, starting match!')
                 self.match_started = True
 
-                for client_socket in self.clients.values():
-                    client_socket.send(pickle.dumps({
+                for connection in self.clients.values():
+                    connection.send({
                         "status": "match_start",
                         "game_state": self.game_state
-                    }))
+                    })
 
             if self.match_started:
                 if current_time - last_broadcast_time >= broadcast_interval:
@@ -272,16 +271,15 @@ class GameServer:
                     game_over_state = True
                     game_over_time = current_time
                     self.logger.info(f'Game_over! Player {winner} wins!')
-                    for i in range(3):
-                        for client_socket in self.clients.values():
-                            try:
-                                client_socket.send(pickle.dumps({
-                                    "status": 'game_over',
-                                    'winner': winner,
-                                    'game_state': self.game_state
-                                }))
-                            except Exception as e:
-                                self.logger.error(f'Error sending game_over: {e}')
+                    for connection in self.clients.values():
+                        try:
+                            connection.send({
+                                "status": 'game_over',
+                                'winner': winner,
+                                'game_state': self.game_state
+                            })
+                        except Exception as e:
+                            self.logger.error(f'Error sending game_over: {e}')
                     time.sleep(0.1)
 
             if game_over_state and current_time - game_over_time >= 5:
@@ -302,11 +300,8 @@ class GameServer:
 
     def close_server(self):
         self.logger.info('Closing server')
-        for client_socket in self.clients.values():
-            try:
-                client_socket.close()
-            except Exception:
-                pass
+        for connection in self.clients.values():
+            connection.close()
         self.server_socket.close()
 
 if __name__ == "__main__":